@@ -0,0 +1,45 @@
+from random import Random
+from timeit import timeit
+
+from day06 import OrbitMap
+
+class WalkingOrbitMap(OrbitMap):
+    # Counts orbits by walking every object's ancestors, like the original.
+    def count_orbits(self):
+        num_orbits = 0
+        for child in self.children:
+            obj = child
+            while obj in self.parents:
+                obj = self.parents[obj]
+                num_orbits += 1
+        return num_orbits
+
+def deep_map(n, seed=0):
+    # Each object orbits one of the few objects added just before it, so
+    # the map is about n / 5 deep.
+    rng = Random(seed)
+    return [["COM" if i == 0 else str(rng.randrange(max(0, i - 10), i)),
+             str(i)] for i in range(n)]
+
+def bench(name, func, number=3):
+    seconds = timeit(func, number=number) / number
+    print("{:<24} {:8.3f} s".format(name, seconds))
+    return seconds
+
+def main():
+    for n in (5 * 10**3, 10**4):
+        orbits = deep_map(n)
+        print("{} objects, depth {}:".format(n, max(OrbitMap(orbits)
+                                                    .depths.values())))
+        build = bench("build and check", lambda: OrbitMap(orbits))
+        orbit_map = OrbitMap(orbits)
+        walking = WalkingOrbitMap(orbits)
+        walked = bench("walked count", walking.count_orbits, number=1)
+        bench("recorded count", orbit_map.count_orbits)
+        assert walking.count_orbits() == orbit_map.count_orbits()
+        print("speedup over building: {:.0f}x".format(walked / build))
+    orbits = deep_map(10**6)
+    bench("build 10**6 objects", lambda: OrbitMap(orbits), number=1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from timeit import timeit
+
+from intcode import IntcodeComputer
+from intcode_compiler import CompiledIntcodeComputer
+from intcode_loader import load_program
+
+class UnfusedIntcodeComputer(IntcodeComputer):
+    # Never matches a superinstruction, so every instruction runs alone.
+    def _match_fusion(self, ip):
+        return None
+
+class UncachedIntcodeComputer(UnfusedIntcodeComputer):
+    # Decodes the instruction again on every step, like the original loop.
+    def _decode(self, ip):
+        instruction = super()._decode(ip)
+        self._decoded.clear()
+        self._decoded_at.clear()
+        return instruction
+
+def bench(name, computer_class, ints, inputs, number=3):
+    seconds = timeit(lambda: computer_class(ints).run(list(inputs)),
+                     number=number) / number
+    print("{:<24} {:8.3f} s".format(name, seconds))
+    return seconds
+
+def bench_construction(name, ints, number=1000):
+    seconds = timeit(lambda: IntcodeComputer(ints), number=number) / number
+    print("{:<24} {:8.1f} us".format(name, seconds * 1e6))
+    return seconds
+
+def main():
+    print("IntcodeComputer construction:")
+    for day in ("05", "09", "13"):
+        bench_construction("day{}".format(day),
+                           load_program("day{}.txt".format(day)))
+    print()
+    ints = load_program("day09.txt")
+    print("day09 BOOST part two:")
+    uncached = bench("uncached decode", UncachedIntcodeComputer, ints, [2])
+    unfused = bench("cached decode", UnfusedIntcodeComputer, ints, [2])
+    print("speedup: {:.1f}x".format(uncached / unfused))
+    cached = bench("superinstructions", IntcodeComputer, ints, [2])
+    print("speedup: {:.2f}x".format(unfused / cached))
+    compiled = bench("compiled blocks", CompiledIntcodeComputer, ints, [2])
+    print("speedup: {:.1f}x".format(cached / compiled))
+    profiled = IntcodeComputer(ints, profile=True)
+    profiled.run([2])
+    print("\nday09 BOOST part two profile:")
+    print(profiled.stats.report())
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import TemporaryDirectory
+import os
 import unittest
 
 def get_fuel(mass):
@@ -11,13 +14,70 @@ def get_fuel2(mass):
         mass = fuel_needed
     return fuel
 
+CHUNK_SIZE = 1 << 20 # Bytes of the manifest read at a time.
+
+def fuel_totals(masses):
+    """Returns the total get_fuel and get_fuel2 of a list of masses.
+
+    The fuel is worked out a level at a time across the whole list, keeping
+    only the fuel that still needs fuel of its own for the next level.
+    """
+    fuel = [mass // 3 - 2 for mass in masses]
+    total = sum(fuel)
+    fuel = [f for f in fuel if f > 0]
+    total2 = 0
+    while fuel:
+        total2 += sum(fuel)
+        fuel = [f // 3 - 2 for f in fuel if f > 8]
+    return total, total2
+
+def _line_start(input_file, offset):
+    # Offset of the first line starting at or after offset.
+    if offset <= 0:
+        return 0
+    input_file.seek(offset - 1)
+    input_file.readline()
+    return input_file.tell()
+
+def _chunk_totals(path, start, end):
+    # Totals of the lines starting in [start, end) of the manifest.
+    with open(path, "rb") as input_file:
+        start = _line_start(input_file, start)
+        end = _line_start(input_file, end)
+        if end <= start:
+            return 0, 0
+        input_file.seek(start)
+        return fuel_totals([int(x) for x in
+                            input_file.read(end - start).split()])
+
+def fuel_required(path, workers=None, chunk_size=CHUNK_SIZE):
+    """Returns (part one, part two) fuel totals for the manifest in path.
+
+    The file is read chunk_size bytes at a time, so memory use doesn't grow
+    with its size. With workers, chunks are summed in that many processes.
+    """
+    size = os.path.getsize(path)
+    starts = range(0, size, chunk_size)
+    ends = [start + chunk_size for start in starts]
+    paths = [path] * len(starts)
+    if workers is None or workers <= 1:
+        chunks = map(_chunk_totals, paths, starts, ends)
+    else:
+        executor = ProcessPoolExecutor(workers)
+        chunks = executor.map(_chunk_totals, paths, starts, ends,
+                              chunksize=16)
+    try:
+        total = total2 = 0
+        for fuel, fuel2 in chunks:
+            total += fuel
+            total2 += fuel2
+    finally:
+        if workers is not None and workers > 1:
+            executor.shutdown()
+    return total, total2
+
 def main():
-    total_fuel = 0
-    total_fuel2 = 0
-    with open("day01.txt") as input_file:
-        for line in input_file:
-            total_fuel += get_fuel(int(line))
-            total_fuel2 += get_fuel2(int(line))
+    total_fuel, total_fuel2 = fuel_required("day01.txt")
     print("Part 1 fuel required: {}".format(total_fuel))
     print("Part 2 fuel required: {}".format(total_fuel2))
 
@@ -36,3 +96,21 @@ class TestGetFuel(unittest.TestCase):
         self.assertEqual(get_fuel2(1969), 966)
         self.assertEqual(get_fuel2(100756), 50346)
 
+    def test_fuel_required(self):
+        with open("day01.txt") as input_file:
+            masses = [int(line) for line in input_file]
+        expected = (sum(map(get_fuel, masses)), sum(map(get_fuel2, masses)))
+        self.assertEqual(fuel_totals(masses), expected)
+        self.assertEqual(fuel_required("day01.txt"), expected)
+        with TemporaryDirectory() as temp:
+            path = os.path.join(temp, "masses.txt")
+            masses = [1, 5, 9, 14, 1969, 100756, 12345678] * 20
+            with open(path, "w") as manifest: # No final newline.
+                manifest.write("\n".join(map(str, masses)))
+            expected = (sum(map(get_fuel, masses)),
+                        sum(map(get_fuel2, masses)))
+            for chunk_size in (1, 7, 64, CHUNK_SIZE):
+                self.assertEqual(fuel_required(path, chunk_size=chunk_size),
+                                 expected)
+            self.assertEqual(fuel_required(path, workers=2, chunk_size=50),
+                             expected)
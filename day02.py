@@ -1,6 +1,8 @@
-from itertools import product
 import unittest
 
+from intcode_loader import load_program
+from intcode_symbolic import solve
+
 OPCODE_ADD = 1
 OPCODE_MULTIPLY = 2
 OPCODE_HALT = 99
@@ -23,18 +25,16 @@ def run_intcode_program(ints, noun=None, verb=None):
     return ints
 
 def main():
-    with open("day02.txt") as input_file:
-        ints = [int(x) for x in input_file.read().split(",")]
+    ints = load_program("day02.txt")
 
     run_ints = run_intcode_program(ints.copy(), noun=12, verb=2)
     print("Part 1 output: {}".format(run_ints[0]))
 
-    for noun, verb in product(range(100), repeat=2):
-        run_ints = run_intcode_program(ints.copy(), noun, verb)
-        if run_ints[0] == 19690720:
-            print("Part 2 output: {} for verb={},noun={}".format(
-                  100 * noun + verb, verb, noun))
-            break
+    solution = solve(ints, 19690720, symbols={1: range(100), 2: range(100)})
+    if solution is not None:
+        noun, verb = solution[1], solution[2]
+        print("Part 2 output: {} for verb={},noun={}".format(
+              100 * noun + verb, verb, noun))
 
 if __name__ == '__main__':
     main()
@@ -1,12 +1,29 @@
+from bisect import bisect_left
+from bisect import bisect_right
+from collections import defaultdict
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappop
+from heapq import heappush
+from random import Random
 import unittest
 
-def get_point_steps(segments):
-    DX = dict(zip("LRUD", [-1, +1, 0, 0]))
-    DY = dict(zip("LRUD", [0, 0, +1, -1]))
+DX = dict(zip("LRUD", [-1, +1, 0, 0]))
+DY = dict(zip("LRUD", [0, 0, +1, -1]))
+
+# The points a wire visits on one move, from (x0, y0) to (x1, y1) inclusive,
+# reaching (x0, y0) after steps steps.
+Segment = namedtuple("Segment",
+                     ("x0", "y0", "x1", "y1", "steps", "horizontal"))
+# A run of points from (x0, y0) to (x1, y1) on both segment1 and segment2.
+Crossing = namedtuple("Crossing",
+                      ("x0", "y0", "x1", "y1", "segment1", "segment2"))
+
+def get_segments(segments):
     x = 0
     y = 0
     steps = 0
-    point_steps = {}
+    result = []
     for segment in segments:
         if not segment:
             continue
@@ -16,32 +33,324 @@ def get_point_steps(segments):
             raise ValueError("Invalid segment direction {}.".format(direction))
         if distance < 1:
             raise ValueError("Invalid segment distance {}.".format(distance))
-        for _ in range(distance):
-            x += DX[direction]
-            y += DY[direction]
-            steps += 1
-            if (x, y) not in point_steps:
-                point_steps[(x, y)] = steps
-    return point_steps
+        dx, dy = DX[direction], DY[direction]
+        result.append(Segment(x + dx, y + dy, x + dx * distance,
+                              y + dy * distance, steps + 1, dy == 0))
+        x += dx * distance
+        y += dy * distance
+        steps += distance
+    return result
+
+def steps_at(segment, x, y):
+    return segment.steps + abs(x - segment.x0) + abs(y - segment.y0)
 
-def get_intersection_point_steps(wire1, wire2): 
-    segments1, segments2 = [x.split(",") for x in [wire1, wire2]]
-    point_steps1 = get_point_steps(segments1)
-    point_steps2 = get_point_steps(segments2)
-    cross_points = point_steps1.keys() & point_steps2.keys()
-    return {pt:[point_steps1[pt], point_steps2[pt]] for pt in cross_points}
+def _span(segment):
+    # The segment's fixed coordinate and the range of the other one.
+    if segment.horizontal:
+        return (segment.y0, min(segment.x0, segment.x1),
+                max(segment.x0, segment.x1))
+    return segment.x0, min(segment.y0, segment.y1), max(segment.y0, segment.y1)
+
+def _perpendicular(horizontals, verticals, horizontal_first):
+    """Yields where horizontal and vertical segments cross, sweeping a line
+    over x. The horizontals under the line are counted in a segment tree
+    over their distinct y values, so a vertical's query only descends into
+    subtrees holding a crossing."""
+    ys = sorted({segment.y0 for segment in horizontals})
+    size = 1
+    while size < len(ys):
+        size *= 2
+    counts = [0] * (2 * size) # Active horizontals under each tree node.
+    at = [set() for _ in ys] # Indices of the active horizontals at each y.
+    events = [] # (x, kind, index), kind orders adds, then queries, then removes.
+    for i, segment in enumerate(horizontals):
+        _, lo, hi = _span(segment)
+        events.append((lo, 0, i))
+        events.append((hi, 2, i))
+    for i, segment in enumerate(verticals):
+        events.append((segment.x0, 1, i))
+    events.sort()
+    for x, kind, i in events:
+        if kind != 1:
+            leaf = bisect_left(ys, horizontals[i].y0)
+            if kind == 0:
+                at[leaf].add(i)
+            else:
+                at[leaf].discard(i)
+            node = leaf + size
+            while node:
+                counts[node] += 1 if kind == 0 else -1
+                node //= 2
+            continue
+        vertical = verticals[i]
+        _, lo, hi = _span(vertical)
+        first, last = bisect_left(ys, lo), bisect_right(ys, hi)
+        stack = [(1, 0, size)] # (node, first leaf, end leaf)
+        while stack:
+            node, start, end = stack.pop()
+            if not counts[node] or end <= first or start >= last:
+                continue
+            if node >= size:
+                for j in at[start]:
+                    y = ys[start]
+                    if horizontal_first:
+                        yield Crossing(x, y, x, y, horizontals[j], vertical)
+                    else:
+                        yield Crossing(x, y, x, y, vertical, horizontals[j])
+                continue
+            middle = (start + end) // 2
+            stack.append((2 * node + 1, middle, end))
+            stack.append((2 * node, start, middle))
+
+def _collinear(segments1, segments2):
+    """Yields where parallel segments of the two wires overlap."""
+    lines = defaultdict(lambda: ([], [])) # {(horizontal, fixed): spans}
+    for which, segments in enumerate((segments1, segments2)):
+        for segment in segments:
+            fixed, lo, hi = _span(segment)
+            lines[segment.horizontal, fixed][which].append(
+                (lo, hi, which, segment))
+    for (horizontal, fixed), (spans1, spans2) in lines.items():
+        if not spans1 or not spans2:
+            continue
+        # Heaps of (hi, order, segment) for the spans of each wire that
+        # reach the sweep position. Every span left in the other wire's heap
+        # after popping those that end before lo overlaps the new one.
+        active = ([], [])
+        spans = sorted(spans1 + spans2, key=lambda span: span[0])
+        for order, (lo, hi, which, segment) in enumerate(spans):
+            other = active[1 - which]
+            while other and other[0][0] < lo:
+                heappop(other)
+            for other_hi, _, other_segment in other:
+                end = min(hi, other_hi)
+                pair = ((segment, other_segment) if which == 0
+                        else (other_segment, segment))
+                if horizontal:
+                    yield Crossing(lo, fixed, end, fixed, *pair)
+                else:
+                    yield Crossing(fixed, lo, fixed, end, *pair)
+            heappush(active[which], (hi, order, segment))
+
+def get_crossings(segments1, segments2):
+    """Yields the Crossings of two wires' segments, in O((n + k) log n) for
+    n segments and k crossings, however long the segments are."""
+    horizontal1 = [s for s in segments1 if s.horizontal]
+    vertical1 = [s for s in segments1 if not s.horizontal]
+    horizontal2 = [s for s in segments2 if s.horizontal]
+    vertical2 = [s for s in segments2 if not s.horizontal]
+    yield from _perpendicular(horizontal1, vertical2, True)
+    yield from _perpendicular(horizontal2, vertical1, False)
+    yield from _collinear(segments1, segments2)
+
+def _clamp(value, lo, hi):
+    return max(lo, min(value, hi))
+
+def get_distance_steps(crossings):
+    """Returns the smallest distance from the origin and the fewest combined
+    steps over crossings, or -1 for both if there are none.
+
+    Along a run of points, steps change linearly, so the fewest are at one
+    of its ends, and the point closest to the origin is the origin clamped
+    to the run.
+    """
+    distance = steps = None
+    for crossing in crossings:
+        x0, y0, x1, y1, segment1, segment2 = crossing
+        closest = (abs(_clamp(0, x0, x1)) + abs(_clamp(0, y0, y1)))
+        fewest = min(steps_at(segment1, x, y) + steps_at(segment2, x, y)
+                     for x, y in ((x0, y0), (x1, y1)))
+        if distance is None:
+            distance, steps = closest, fewest
+        else:
+            distance, steps = min(distance, closest), min(steps, fewest)
+    return (-1, -1) if distance is None else (distance, steps)
+
+def parse_wire(wire):
+    return get_segments(wire.split(","))
+
+def get_intersection_point_steps(wire1, wire2):
+    """Returns {point: [steps1, steps2]} for every point both wires visit,
+    with the fewest steps each wire takes to get there."""
+    point_steps = {}
+    for crossing in get_crossings(parse_wire(wire1), parse_wire(wire2)):
+        x0, y0, x1, y1, segment1, segment2 = crossing
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                steps = [steps_at(segment1, x, y), steps_at(segment2, x, y)]
+                if (x, y) in point_steps:
+                    steps = [min(a, b) for a, b in zip(steps,
+                                                       point_steps[x, y])]
+                point_steps[x, y] = steps
+    return point_steps
 
 def get_manhattan_distance(wire1, wire2):
-    point_steps = get_intersection_point_steps(wire1, wire2)
-    if not point_steps:
-        return -1
-    return min([abs(x) + abs(y) for x, y in point_steps.keys()])
+    return get_distance_steps(get_crossings(parse_wire(wire1),
+                                            parse_wire(wire2)))[0]
 
 def get_fewest_steps(wire1, wire2):
-    point_steps = get_intersection_point_steps(wire1, wire2)
-    if not point_steps:
-        return -1
-    return min([steps[0] + steps[1] for steps in point_steps.values()])
+    return get_distance_steps(get_crossings(parse_wire(wire1),
+                                            parse_wire(wire2)))[1]
+
+class WireIndex:
+    """Segments of many wires, indexed by axis for crossing queries.
+
+    Each wire is added once. For each orientation, a segment tree over the
+    coordinates the segments span holds each segment in the O(log n) nodes
+    covering its span, sorted by fixed coordinate. The perpendicular
+    segments crossing one are then found on the path to its fixed
+    coordinate, bisecting each node for the range it spans, in
+    O(log^2 n + k) however long the segments are and without rescanning
+    the other wires.
+    """
+    def __init__(self, wires=()):
+        self.wires = [] # Segments of each wire, by id.
+        # For horizontal (True) and vertical (False) segments, their
+        # (fixed, lo, hi, wire id, segment) entries.
+        self._entries = {True: [], False: []}
+        self._trees = None # Built from _entries by _build().
+        # {(horizontal, fixed): [(lo, hi, wire id, segment)]}
+        self._lines = defaultdict(list)
+        for wire in wires:
+            self.add(wire)
+
+    def __len__(self):
+        return len(self.wires)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_trees"] = None # Workers rebuild them rather than unpickle.
+        return state
+
+    def add(self, wire):
+        """Adds a wire (a string of moves or a list of Segments) and returns
+        its id."""
+        segments = parse_wire(wire) if isinstance(wire, str) else list(wire)
+        wire_id = len(self.wires)
+        self.wires.append(segments)
+        for segment in segments:
+            fixed, lo, hi = _span(segment)
+            entry = (fixed, lo, hi, wire_id, segment)
+            self._entries[segment.horizontal].append(entry)
+            self._lines[segment.horizontal, fixed].append(entry[1:])
+        self._trees = None
+        return wire_id
+
+    @staticmethod
+    def _slot(coords, value):
+        # Leaf of value among the sorted span ends coords: odd leaves are
+        # the ends themselves and even ones the gaps around them.
+        i = bisect_left(coords, value)
+        return 2 * i + 1 if i < len(coords) and coords[i] == value else 2 * i
+
+    def _build(self):
+        self._trees = {}
+        for horizontal, entries in self._entries.items():
+            coords = sorted({c for entry in entries for c in entry[1:3]})
+            size = 1
+            while size < 2 * len(coords) + 1:
+                size *= 2
+            nodes = defaultdict(list)
+            for entry in entries:
+                first = self._slot(coords, entry[1]) + size
+                last = self._slot(coords, entry[2]) + size + 1
+                while first < last:
+                    if first & 1:
+                        nodes[first].append(entry)
+                        first += 1
+                    if last & 1:
+                        last -= 1
+                        nodes[last].append(entry)
+                    first //= 2
+                    last //= 2
+            for node, node_entries in nodes.items():
+                node_entries.sort(key=lambda entry: entry[0])
+                nodes[node] = ([entry[0] for entry in node_entries],
+                               node_entries)
+            self._trees[horizontal] = (coords, size, dict(nodes))
+
+    def crossings(self, wire_id, others=None):
+        """Returns {other id: [Crossing]} for the wires that cross wire_id,
+        optionally only those in others. Each Crossing's segment1 is on
+        wire_id."""
+        if self._trees is None:
+            self._build()
+        result = defaultdict(list)
+        for segment in self.wires[wire_id]:
+            fixed, lo, hi = _span(segment)
+            horizontal = segment.horizontal
+            # Perpendicular segments spanning this one's fixed coordinate,
+            # with their own fixed coordinate in lo..hi.
+            coords, size, nodes = self._trees[not horizontal]
+            node = self._slot(coords, fixed) + size
+            while node:
+                if node in nodes:
+                    fixeds, entries = nodes[node]
+                    for j in range(bisect_left(fixeds, lo),
+                                   bisect_right(fixeds, hi)):
+                        other_fixed, _, _, other_id, other = entries[j]
+                        if other_id == wire_id or (others is not None and
+                                                   other_id not in others):
+                            continue
+                        x, y = ((other_fixed, fixed) if horizontal
+                                else (fixed, other_fixed))
+                        result[other_id].append(
+                            Crossing(x, y, x, y, segment, other))
+                node //= 2
+            # Parallel segments on the same line that overlap this one.
+            for other_lo, other_hi, other_id, other in self._lines.get(
+                    (horizontal, fixed), ()):
+                start, end = max(lo, other_lo), min(hi, other_hi)
+                if (other_id == wire_id or start > end
+                        or others is not None and other_id not in others):
+                    continue
+                if horizontal:
+                    crossing = Crossing(start, fixed, end, fixed, segment, other)
+                else:
+                    crossing = Crossing(fixed, start, fixed, end, segment, other)
+                result[other_id].append(crossing)
+        return dict(result)
+
+    def distance_steps(self, wire_id, others=None):
+        """Returns {other id: (distance, steps)}: the crossing closest to the
+        origin and the fewest combined steps, for each wire crossing
+        wire_id."""
+        return {other_id: get_distance_steps(crossings) for other_id, crossings
+                in self.crossings(wire_id, others).items()}
+
+    def all_distance_steps(self, workers=None, chunksize=64):
+        """Returns {(a, b): (distance, steps)} for every pair of crossing
+        wires a < b. With workers, wires are queried across a process pool
+        that receives the index once per worker."""
+        ids = range(len(self.wires))
+        chunks = [ids[i:i + chunksize] for i in range(0, len(ids), chunksize)]
+        if workers is None or workers <= 1:
+            results = map(self._distance_steps_after, chunks)
+        else:
+            executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                           initargs=(self,))
+            results = executor.map(_distance_steps_after, chunks)
+        try:
+            return {(a, b): result for chunk in results
+                    for a, b, result in chunk}
+        finally:
+            if workers is not None and workers > 1:
+                executor.shutdown()
+
+    def _distance_steps_after(self, wire_ids):
+        # [(a, b, (distance, steps))] for the wires b > a crossing each a.
+        return [(a, b, result) for a in wire_ids
+                for b, result in sorted(self.distance_steps(
+                    a, range(a + 1, len(self.wires))).items())]
+
+_worker_index = None # WireIndex shared by every query in a worker.
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+def _distance_steps_after(wire_ids):
+    return _worker_index._distance_steps_after(wire_ids)
 
 def main():
     with open("day03.txt") as input_file:
@@ -84,3 +393,74 @@ class TestWireIntersections(unittest.TestCase):
                          "R98,U47,R26,D63,R33,U87,L62,D20,R33,U53,R51",
                          "U98,R91,D20,R16,D67,R40,U7,R15,U6,R7"),
                          410)
+
+    def test_segment_engine(self):
+        def walk(wire):
+            # Every point the wire visits, with the fewest steps to it.
+            x, y, steps, points = 0, 0, 0, {}
+            for segment in wire.split(","):
+                for _ in range(int(segment[1:])):
+                    x += DX[segment[0]]
+                    y += DY[segment[0]]
+                    steps += 1
+                    points.setdefault((x, y), steps)
+            return points
+        rng = Random(0)
+        for _ in range(200):
+            wire1, wire2 = (",".join(rng.choice("LRUD") +
+                                     str(rng.randint(1, 6))
+                                     for _ in range(rng.randint(1, 12)))
+                            for _ in range(2))
+            points1, points2 = walk(wire1), walk(wire2)
+            expected = {p: [points1[p], points2[p]]
+                        for p in points1.keys() & points2.keys()}
+            self.assertEqual(get_intersection_point_steps(wire1, wire2),
+                             expected, (wire1, wire2))
+            self.assertEqual(get_manhattan_distance(wire1, wire2),
+                             min((abs(x) + abs(y) for x, y in expected),
+                                 default=-1))
+            self.assertEqual(get_fewest_steps(wire1, wire2),
+                             min(map(sum, expected.values()), default=-1))
+        # Long segments don't cost more than short ones.
+        self.assertEqual(get_manhattan_distance("R1000000000,U5",
+                                                "U3,R2000000000"), 3 + 10**9)
+        self.assertEqual(get_fewest_steps("L5,R1000000000",
+                                          "D2,R7,U2,L1"), 28)
+
+    def test_wire_index(self):
+        rng = Random(1)
+        wires = [",".join(rng.choice("LRUD") + str(rng.randint(1, 8))
+                          for _ in range(rng.randint(1, 10)))
+                 for _ in range(40)]
+        index = WireIndex(wires)
+        self.assertEqual(len(index), 40)
+        expected = {}
+        for a in range(len(wires)):
+            for b in range(a + 1, len(wires)):
+                result = get_distance_steps(get_crossings(index.wires[a],
+                                                          index.wires[b]))
+                if result != (-1, -1):
+                    expected[a, b] = result
+        self.assertTrue(expected)
+        self.assertEqual(index.all_distance_steps(), expected)
+        self.assertEqual(index.all_distance_steps(workers=2, chunksize=8),
+                         expected)
+        crossings = index.crossings(0)
+        self.assertNotIn(0, crossings)
+        for other, found in crossings.items():
+            self.assertEqual(get_distance_steps(found), get_distance_steps(
+                get_crossings(index.wires[0], index.wires[other])))
+        wire_id = index.add("R8,U5,L5,D3")
+        self.assertEqual(index.distance_steps(index.add("U7,R6,D4,L4"),
+                                              {wire_id}), {wire_id: (6, 30)})
+        # Long segments are stored once, like short ones.
+        index = WireIndex(["R100000000,U5", "U3,R200000000",
+                           "D1,R50000000,U100"])
+        self.assertEqual(index.all_distance_steps(), {
+            (0, 1): (10**8 + 3, 2 * 10**8 + 6),
+            (0, 2): (5 * 10**7, 10**8 + 2),
+            (1, 2): (5 * 10**7 + 3, 10**8 + 8)})
+        for horizontal in (True, False):
+            _, _, nodes = index._trees[horizontal]
+            self.assertLess(sum(len(entries) for _, entries in
+                                nodes.values()), 20)
@@ -1,4 +1,6 @@
 from collections import Counter
+from functools import lru_cache
+from random import Random
 import unittest
 
 def is_valid_password(password, require_double_group=False):
@@ -12,16 +14,132 @@ def is_valid_password(password, require_double_group=False):
     else:
         return any(count > 1 for count in digit_counts.values())
 
+def _step(previous, run, pair, double, digit):
+    # State after appending digit: the length of the current run of equal
+    # digits (capped at 3) and whether an earlier run had 2+ or exactly 2.
+    if digit == previous:
+        return min(run + 1, 3), pair, double
+    return 1, pair or run >= 2, double or run == 2
+
+@lru_cache(maxsize=None)
+def _completions(remaining, previous, run, pair, double):
+    """Returns how many ways of appending remaining non-decreasing digits
+    make a valid password, under each rule set, as (part one, part two)."""
+    if remaining == 0:
+        return int(pair or run >= 2), int(double or run == 2)
+    one = two = 0
+    for digit in range(previous, 10):
+        counts = _completions(remaining - 1, digit,
+                              *_step(previous, run, pair, double, digit))
+        one += counts[0]
+        two += counts[1]
+    return one, two
+
+def _count_up_to(upper):
+    # (part one, part two) counts of valid passwords in 0..upper.
+    if upper < 10:
+        return 0, 0
+    digits = [int(d) for d in str(upper)]
+    # Every valid password with fewer digits (none have a 0 digit).
+    one = two = 0
+    for length in range(2, len(digits)):
+        counts = _completions(length, 1, 0, False, False)
+        one += counts[0]
+        two += counts[1]
+    # Then those with as many digits, walking down upper's digits.
+    state = (1, 0, False, False) # Previous digit, run, pair, double.
+    for i, limit in enumerate(digits):
+        for digit in range(state[0], limit):
+            counts = _completions(len(digits) - i - 1, digit,
+                                  *_step(*state, digit))
+            one += counts[0]
+            two += counts[1]
+        if limit < state[0]:
+            return one, two # No number with upper's prefix is non-decreasing.
+        state = (limit,) + _step(*state, limit)
+    counts = _completions(0, *state)
+    return one + counts[0], two + counts[1]
+
+def count_valid_passwords(lower, upper):
+    """Returns how many passwords in lower..upper are valid under each rule
+    set, as (part one, part two), in time polynomial in the number of
+    digits."""
+    if lower < 0:
+        raise ValueError("Invalid password range {}-{}.".format(lower, upper))
+    if upper < lower:
+        return 0, 0
+    below = _count_up_to(lower - 1) if lower > 0 else (0, 0)
+    counts = _count_up_to(upper)
+    return counts[0] - below[0], counts[1] - below[1]
+
+def _next_non_decreasing(number):
+    # Digits of the smallest number >= number with non-decreasing digits.
+    digits = [int(d) for d in str(number)]
+    for i in range(1, len(digits)):
+        if digits[i] < digits[i - 1]:
+            digits[i:] = [digits[i - 1]] * (len(digits) - i)
+            break
+    return digits
+
+def _has_group(digits, require_double_group):
+    # Non-decreasing digits only, so equal digits form one group.
+    counts = [digits.count(d) for d in set(digits)]
+    if require_double_group:
+        return 2 in counts
+    return any(count > 1 for count in counts)
+
+def valid_passwords(lower=0, upper=None, require_double_group=False):
+    """Yields the valid passwords from lower to upper (or without end) in
+    order.
+
+    Only numbers with non-decreasing digits are visited: after each one,
+    the rightmost digit below 9 is incremented and copied into the digits
+    after it.
+    """
+    digits = _next_non_decreasing(max(lower, 11))
+    while True:
+        number = int("".join(map(str, digits)))
+        if upper is not None and number > upper:
+            return
+        if _has_group(digits, require_double_group):
+            yield number
+        i = len(digits) - 1
+        while i >= 0 and digits[i] == 9:
+            i -= 1
+        if i < 0:
+            digits = [1] * (len(digits) + 1)
+        else:
+            digits[i:] = [digits[i] + 1] * (len(digits) - i)
+
+def nth_valid_password(n, lower=0, require_double_group=False):
+    """Returns the valid password with n valid passwords (counting from 0)
+    between lower and it, picking each digit by its completion counts."""
+    if n < 0 or lower < 0:
+        raise ValueError("Invalid password index {} from {}.".format(n, lower))
+    part = 1 if require_double_group else 0
+    if lower > 0:
+        n += _count_up_to(lower - 1)[part]
+    length = 2
+    while n >= _completions(length, 1, 0, False, False)[part]:
+        n -= _completions(length, 1, 0, False, False)[part]
+        length += 1
+    state = (1, 0, False, False) # Previous digit, run, pair, double.
+    password = 0
+    for remaining in reversed(range(length)):
+        for digit in range(state[0], 10):
+            next_state = (digit,) + _step(*state, digit)
+            count = _completions(remaining, *next_state)[part]
+            if n < count:
+                break
+            n -= count
+        state = next_state
+        password = password * 10 + digit
+    return password
+
 def main():
     with open("day04.txt") as input_file:
         lower, upper  = [int(x) for x in input_file.read().split("-")]
-    num_passwords = 0
-    num_passwords_strict = 0
-    for num in range(lower, upper+1):
-        if is_valid_password(num):
-            num_passwords += 1
-        if is_valid_password(num, require_double_group=True):
-            num_passwords_strict += 1
+    num_passwords, num_passwords_strict = count_valid_passwords(lower, upper)
     print("Part one passwords: {}".format(num_passwords))
     print("Part two passwords: {}".format(num_passwords_strict))
 
@@ -41,3 +159,48 @@ class TestIsValidPassword(unittest.TestCase):
         self.assertTrue(is_valid_password(111122, require_double_group=True))
         self.assertFalse(is_valid_password(222234, require_double_group=True))
         self.assertTrue(is_valid_password(122444, require_double_group=True))
+
+    def test_count_valid_passwords(self):
+        def brute_force(lower, upper):
+            numbers = range(lower, upper + 1)
+            return (sum(is_valid_password(n) for n in numbers),
+                    sum(is_valid_password(n, require_double_group=True)
+                        for n in numbers))
+        rng = Random(0)
+        ranges = [(0, 0), (0, 200), (11, 11), (10, 10), (99, 123),
+                  (193641, 649729), (5, 3)]
+        for _ in range(50):
+            lower = rng.randint(0, 10**rng.randint(1, 6))
+            ranges.append((lower, lower + rng.randint(0, 5000)))
+        for lower, upper in ranges:
+            self.assertEqual(count_valid_passwords(lower, upper),
+                             brute_force(lower, upper), (lower, upper))
+        self.assertEqual(count_valid_passwords(10**18 - 10**4, 10**18),
+                         brute_force(10**18 - 10**4, 10**18))
+        self.assertGreater(count_valid_passwords(0, 10**18)[0], 0)
+        self.assertRaises(ValueError, count_valid_passwords, -1, 5)
+
+    def test_valid_passwords(self):
+        for require_double_group in (False, True):
+            expected = [n for n in range(2000, 40000) if is_valid_password(
+                n, require_double_group=require_double_group)]
+            found = list(valid_passwords(2000, 40000, require_double_group))
+            self.assertEqual(found, expected)
+            for i in (0, 1, 17, len(expected) - 1):
+                self.assertEqual(nth_valid_password(i, 2000,
+                                                    require_double_group),
+                                 expected[i])
+        self.assertEqual(list(valid_passwords(0, 33)), [11, 22, 33])
+        self.assertEqual(next(valid_passwords(99)), 99)
+        self.assertEqual(next(valid_passwords(100)), 111)
+        passwords = valid_passwords(10**17)
+        self.assertEqual([next(passwords) for _ in range(3)],
+                         [111111111111111111, 111111111111111112,
+                          111111111111111113])
+        self.assertEqual(nth_valid_password(0), 11)
+        # The last of the valid passwords up to 10**18.
+        count = count_valid_passwords(0, 10**18)[1]
+        self.assertEqual(nth_valid_password(count - 1,
+                                            require_double_group=True),
+                         889999999999999999)
+        self.assertRaises(ValueError, nth_valid_password, -1)
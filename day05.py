@@ -1,6 +1,8 @@
 from collections import namedtuple
 import unittest
 
+from intcode_loader import load_program
+
 Opcode = namedtuple("Opcode", ("name", "params", "outputs"))
 OPCODES = {
     1: Opcode("ADD", 3, 1),
@@ -72,8 +74,7 @@ def run_intcode(ints, input_id=None, verbose=False):
     return outputs
 
 def main():
-    with open("day05.txt") as input_file:
-        ints = [int(x) for x in input_file.read().split(",")]
+    ints = load_program("day05.txt")
 
     print("Part 1 output: {}".format(run_intcode(ints.copy(), 1)[-1]))
     print("Part 2 output: {}".format(run_intcode(ints.copy(), 5)[0]))
@@ -1,45 +1,58 @@
 import unittest
 
 class OrbitMap:
+    """Orbits checked and measured in one pass over the map.
+
+    Each object's depth (its number of direct and indirect orbits) is
+    recorded by a breadth-first walk down from the root, which also finds
+    any objects in a cycle, since the walk never reaches them.
+    """
     def __init__(self, orbits):
-        self.children = set()
         self.parents = {} # {satellite: primary}
+        satellites = {} # {primary: [satellite]}
         for primary, satellite in orbits:
-            self.children.add(satellite)
             if satellite in self.parents:
                 raise ValueError("Object {} is orbiting {}. Cannot orbit {}."
                     .format(satellite, self.parents[satellite], primary))
             self.parents[satellite] = primary
-        root = self._get_ancestors(next(iter(self.children)))[-1]
-        for c in self.children:
-            if root != self._get_ancestors(c)[-1]:
-                raise ValueError("Invalid orbit map: multiple COM: {}, {}."
-                                 .format(root, self._get_ancestors(c)[-1]))
-
-    def _get_ancestors(self, obj):
-        ancestors = [obj]
-        visited = set()
-        while ancestors[-1] in self.parents:
-            if ancestors[-1] in visited:
-                raise ValueError("Cycle in orbit map: {}.". format(ancestors))
-            visited.add(ancestors[-1])
-            ancestors.append(self.parents[ancestors[-1]])
-        return ancestors[1:]
+            satellites.setdefault(primary, []).append(satellite)
+        if not self.parents:
+            raise ValueError("Empty orbit map.")
+        self.children = set(self.parents)
+        roots = [p for p in satellites if p not in self.parents]
+        if len(roots) > 1:
+            raise ValueError("Invalid orbit map: multiple COM: {}, {}."
+                             .format(roots[0], roots[1]))
+        self.depths = {root: 0 for root in roots} # {object: orbits}
+        level = roots
+        depth = 0
+        while level:
+            depth += 1
+            level = [satellite for primary in level
+                     for satellite in satellites.get(primary, ())]
+            for satellite in level:
+                self.depths[satellite] = depth
+        if len(self.depths) < len(self.children) + len(roots):
+            cycle = [c for c in self.children if c not in self.depths]
+            raise ValueError("Cycle in orbit map: {}.".format(cycle))
+        self._num_orbits = sum(self.depths.values())
 
     def count_orbits(self):
-        num_orbits = 0
-        # This could be improved by caching num_orbits for each ancestor.
-        for child in self.children:
-            num_orbits += len(self._get_ancestors(child))
-        return num_orbits
-    
+        return self._num_orbits
+
     def min_transfers(self, a, b):
-        a_ancestors = self._get_ancestors(a)
-        b_ancestors = self._get_ancestors(b)
-        for i, ancestor in enumerate(a_ancestors):
-            if ancestor in b_ancestors:
-                return i + b_ancestors.index(ancestor)
-        return -1
+        if a not in self.parents or b not in self.parents:
+            return -1
+        a, b = self.parents[a], self.parents[b]
+        transfers = 0
+        # Climb from the deeper object until both meet at a common ancestor.
+        while a != b:
+            if self.depths[a] >= self.depths[b]:
+                a = self.parents[a]
+            else:
+                b = self.parents[b]
+            transfers += 1
+        return transfers
 
 def main():
     with open("day06.txt") as input_file:
@@ -77,6 +90,13 @@ class TestOrbitMap(unittest.TestCase):
             ["A", "D"]]
         self.assertRaises(ValueError, OrbitMap, cycle_map_with_multiple_roots)
 
+        cycle_map_with_root = [
+            ["COM", "B"],
+            ["C", "D"],
+            ["D", "C"]]
+        self.assertRaises(ValueError, OrbitMap, cycle_map_with_root)
+        self.assertRaises(ValueError, OrbitMap, [])
+
     def test_count_orbits(self):
         self.assertEqual(OrbitMap([["COM", "B"]]).count_orbits(), 1)
 
@@ -134,4 +154,12 @@ class TestOrbitMap(unittest.TestCase):
             ["I", "SAN"]]
         example_map = OrbitMap(example_map)
         self.assertEqual(example_map.min_transfers("YOU","SAN"), 4)
-        
+
+    def test_deep_map(self):
+        n = 10**5
+        chain = [[str(i), str(i + 1)] for i in range(n)]
+        chain.append(["0", "YOU"])
+        orbit_map = OrbitMap(chain)
+        self.assertEqual(orbit_map.count_orbits(), n * (n + 1) // 2 + 1)
+        self.assertEqual(orbit_map.depths[str(n)], n)
+        self.assertEqual(orbit_map.min_transfers("YOU", str(n)), n - 1)
@@ -1,39 +1,107 @@
 from intcode import IntcodeComputer
-from itertools import permutations
+from intcode_loader import load_program
+from intcode_network import Network
+from intcode_network import run_networks
 import unittest
 
-def max_thruster_series(ints, inputs=range(5)):
-    max_output_phases = (0, None)
-    for phases in permutations(inputs):
-        phase_list = list(phases)
-        prev_output = 0
-        amps = [IntcodeComputer(ints.copy()) for _ in phases]
-        for amp in amps:
-            prev_output = amp.run([phase_list.pop(0), prev_output])
-        if prev_output > max_output_phases[0]:
-            max_output_phases = prev_output, phases
-    return max_output_phases
-
-def max_thruster_feedback(ints, inputs=range(5,10)):
-    max_output_phases = (0, None)
-    for phases in permutations(inputs):
-        phase_list = list(phases)
-        prev_output = 0
-        amps = [IntcodeComputer(ints.copy(), wait_for_input=True)
-                for _ in phases]
-        while not amps[0].is_done():
-            for amp in amps:
-                inputs = [prev_output]
-                if phase_list:
-                    inputs.insert(0, phase_list.pop(0))
-                prev_output = amp.run(inputs)
-            if prev_output is not None and prev_output > max_output_phases[0]:
-                max_output_phases = prev_output, phases
-    return max_output_phases
+def prime_amps(ints, inputs):
+    # Each amp paused right after reading its phase, ready to be forked.
+    primed = {}
+    for phase in inputs:
+        primed[phase] = IntcodeComputer(ints, wait_for_input=True)
+        primed[phase].run([phase])
+    return primed
+
+def max_thruster_series(ints, inputs=range(5), length=None, bound=None):
+    """Returns (max output, phases) over chains of length amps (one per
+    phase by default) with distinct phases from inputs.
+
+    Phase orders are searched as a trie of prefixes. An amp's output only
+    depends on its phase and the signal coming in, so each stage is run
+    once per (phase, signal), and the best way to finish a chain from a
+    signal with a given set of unused phases is found once. If given,
+    bound(signal, amps_left) is an upper bound on the final output of any
+    chain finishing from signal, used to prune prefixes that can't beat the
+    best output seen so far.
+    """
+    primed = prime_amps(ints, inputs)
+    length = len(primed) if length is None else length
+    stages = {} # {(phase, signal): output}
+    finishes = {} # {(signal, unused phases): (output, phases) or None}
+    best = [0]
+
+    def finish(signal, unused, amps_left):
+        # The best (output, phases) finishing from signal, or None if every
+        # finish was pruned. Pruned finishes can't beat best, which only
+        # grows, so the memoized result stays good for later prefixes.
+        if amps_left == 0:
+            best[0] = max(best[0], signal)
+            return signal, ()
+        key = (signal, unused)
+        if key in finishes:
+            return finishes[key]
+        result = None
+        if bound is None or bound(signal, amps_left) > best[0]:
+            for phase in unused:
+                if (phase, signal) not in stages:
+                    stages[phase, signal] = primed[phase].fork().run([signal])
+            order = unused
+            if bound is not None: # Try the strongest signals first.
+                order = sorted(unused, key=lambda p: -stages[p, signal])
+            for phase in order:
+                rest = finish(stages[phase, signal],
+                              tuple(p for p in unused if p != phase),
+                              amps_left - 1)
+                if rest is not None and (result is None or rest[0] > result[0]):
+                    result = rest[0], (phase,) + rest[1]
+        finishes[key] = result
+        return result
+
+    result = finish(0, tuple(primed), length)
+    if result is None or result[0] <= 0:
+        return (0, None)
+    return result
+
+def max_thruster_feedback(ints, inputs=range(5,10), length=None):
+    """Returns (max output, phases) over feedback loops of length amps (one
+    per phase by default) with distinct phases from inputs.
+
+    The first pass around the loop only depends on the phase prefix, so it
+    is searched as a trie like max_thruster_series, keeping each amp paused
+    after its first pass. Each full loop then forks its amps and finishes in
+    a Network.
+    """
+    primed = prime_amps(ints, inputs)
+    length = len(primed) if length is None else length
+    stages = {} # {(phase, signals): (paused amp, outputs)}
+    loops = [] # [(network, last node, first pass outputs, phases)]
+
+    def extend(phases, amps, signals):
+        if len(phases) == length:
+            network = Network()
+            nodes = [network.add(amp.fork()) for amp in amps]
+            network.chain(nodes, ring=True)
+            for signal in signals:
+                network.send(nodes[0], signal)
+            loops.append((network, nodes[-1], signals, phases))
+            return
+        for phase in primed:
+            if phase in phases:
+                continue
+            if (phase, signals) not in stages:
+                amp = primed[phase].fork()
+                stages[phase, signals] = amp, tuple(amp.stream(list(signals)))
+            amp, outputs = stages[phase, signals]
+            extend(phases + (phase,), amps + [amp], outputs)
+
+    extend((), [], (0,))
+    run_networks([network for network, _, _, _ in loops])
+    return max((((last.outputs or signals)[-1], phases)
+                for _, last, signals, phases in loops
+                if last.outputs or signals), default=(0, None))
 
 def main():
-    with open("day07.txt") as input_file:
-        ints = [int(x) for x in input_file.read().split(",")]
+    ints = load_program("day07.txt")
     
     print("Part 1 output: {}".format(max_thruster_series(ints)[0]))
     print("Part 2 output: {}".format(max_thruster_feedback(ints)[0]))
@@ -63,3 +131,31 @@ class TestMaxThruster(unittest.TestCase):
             -5,54,1105,1,12,1,53,54,53,1008,54,0,55,1001,55,1,55,2,53,55,53,4,
             53,1001,56,-1,56,1005,56,6,99,0,0,0,0,10]
         self.assertEqual(max_thruster_feedback(ints2), (18216, (9,7,8,5,6)))
+
+    def test_search_options(self):
+        # Outputs 10 * signal + phase, like ints1 in test_max_thruster_series.
+        ints = [3,15,3,16,1002,16,10,16,1,16,15,15,4,15,99,0,0]
+        self.assertEqual(max_thruster_series(ints, range(3), length=2),
+                         (21, (2, 1)))
+        self.assertEqual(max_thruster_series(ints, range(6)),
+                         (543210, (5,4,3,2,1,0)))
+        calls = []
+        def bound(signal, amps_left):
+            calls.append(signal)
+            return (signal + 1) * 10**amps_left
+        self.assertEqual(max_thruster_series(ints, range(9), bound=bound),
+                         (876543210, (8,7,6,5,4,3,2,1,0)))
+        self.assertLess(len(calls), 100)
+        ints1 = [3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,
+                 27,4,27,1001,28,-1,28,1005,28,6,99,0,0,5]
+        self.assertEqual(max_thruster_feedback(ints1, range(5, 10), length=3),
+                         max(max_thruster_feedback(ints1, phases)
+                             for phases in ([5,6,7], [5,6,8], [5,6,9],
+                                            [5,7,8], [5,7,9], [5,8,9],
+                                            [6,7,8], [6,7,9], [6,8,9],
+                                            [7,8,9])))
+        # More amps than phases.
+        self.assertEqual(max_thruster_series(ints, range(2), length=3),
+                         (0, None))
+        self.assertEqual(max_thruster_feedback(ints1, range(2), length=3),
+                         (0, None))
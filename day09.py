@@ -1,10 +1,10 @@
-from intcode import IntcodeComputer
+from intcode_cache import cached_run
+from intcode_loader import load_program
 
 def main():
-    with open("day09.txt") as input_file:
-        ints = [int(x) for x in input_file.read().split(",")]
-    print("Part one solution: {}".format(IntcodeComputer(ints).run([1])))
-    print("Part two solution: {}".format(IntcodeComputer(ints).run([2])))
+    ints = load_program("day09.txt")
+    print("Part one solution: {}".format(cached_run(ints, [1]).outputs[0]))
+    print("Part two solution: {}".format(cached_run(ints, [2]).outputs[0]))
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,8 @@
-from collections import defaultdict
+import unittest
 
 from intcode import IntcodeComputer
+from intcode_loader import load_program
+from renderer import render
 
 dxy = [
     [0, 1], # up
@@ -8,38 +10,139 @@ dxy = [
     [0, -1], # down
     [-1, 0]] # left
 
-def update(coords, direction, turn_right):
-    direction = (direction + (1 if turn_right else -1)) % 4
-    coords = [coords[0] + dxy[direction][0], coords[1] + dxy[direction][1]]
-    return coords, direction
+class Canvas:
+    """Hull panels kept as a flat grid of colors around the robot's start.
 
-def get_painted_panels(ints, initial_color):
-    panels = defaultdict(int) # { (x, y): color }
-    computer = IntcodeComputer(ints, wait_for_input=True)
-    coords = [0, 0]
+    The grid doubles in width or height toward whichever edge a panel lands
+    past, so it stays contiguous however far the robot goes. A mask records
+    which panels were ever painted, so len() is a count over the mask.
+    """
+    def __init__(self, width=16, height=16):
+        self.width = width
+        self.height = height
+        self.origin = (width // 2, height // 2) # Grid cell of panel (0, 0).
+        self.colors = bytearray(width * height)
+        self.painted = bytearray(width * height)
+
+    def __len__(self):
+        return self.painted.count(1)
+
+    def __getitem__(self, coords):
+        col, row = coords[0] + self.origin[0], coords[1] + self.origin[1]
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return self.colors[row * self.width + col]
+        return 0
+
+    def index(self, x, y):
+        """Index of panel (x, y) in colors and painted, growing to fit it."""
+        col, row = x + self.origin[0], y + self.origin[1]
+        if not (0 <= col < self.width and 0 <= row < self.height):
+            self._grow(col, row)
+            col, row = x + self.origin[0], y + self.origin[1]
+        return row * self.width + col
+
+    def paint(self, x, y, color):
+        i = self.index(x, y)
+        self.colors[i] = color
+        self.painted[i] = 1
+
+    def lines(self):
+        """Returns the painted area as strings, top row (largest y) first."""
+        width = self.width
+        rows = [r for r in range(self.height)
+                if any(self.painted[r * width:(r + 1) * width])]
+        if not rows:
+            return []
+        cols = [c for c in range(width) if any(self.painted[c::width])]
+        left, right = cols[0], cols[-1] + 1
+        return ["".join(u"\u2588" if color else " " for color in
+                        self.colors[r * width + left:r * width + right])
+                for r in reversed(range(rows[0], rows[-1] + 1))]
+
+    def _grow(self, col, row):
+        width, left = self.width, 0
+        while col + left < 0:
+            left += width
+            width *= 2
+        while col + left >= width:
+            width *= 2
+        height, bottom = self.height, 0
+        while row + bottom < 0:
+            bottom += height
+            height *= 2
+        while row + bottom >= height:
+            height *= 2
+        colors = bytearray(width * height)
+        painted = bytearray(width * height)
+        for r in range(self.height):
+            old = r * self.width
+            new = (r + bottom) * width + left
+            colors[new:new + self.width] = self.colors[old:old + self.width]
+            painted[new:new + self.width] = self.painted[old:old + self.width]
+        self.width, self.height = width, height
+        self.origin = (self.origin[0] + left, self.origin[1] + bottom)
+        self.colors, self.painted = colors, painted
+
+def get_painted_panels(ints, initial_color, canvas=None):
+    """Runs the robot and returns the Canvas it painted."""
+    if canvas is None:
+        canvas = Canvas()
+    computer = IntcodeComputer(ints)
+    x, y = 0, 0
     direction = 0 # initially point up
-    panels[tuple(coords)] = initial_color
-    while not computer.is_done():
-        color, turn = computer.run(inputs=[panels[tuple(coords)]])
-        panels[tuple(coords)] = color # white = 1
-        coords, direction = update(coords, direction, turn)
-    return panels
-
-def print_panels(panels):
-    xs, ys = zip(*panels.keys())
-    # Print from bottom to top (since up is positive)
-    for y in reversed(range(min(ys), max(ys) + 1)):
-        for x in range(min(xs), max(xs) + 1):
-            print(u"\u2588" if panels[(x,y)] else " ", end="")
-        print()
+    canvas.paint(x, y, initial_color)
+    here = canvas.index(x, y)
+    camera = lambda: canvas.colors[here]
+    for color, turn in computer.stream(camera, group=2):
+        canvas.colors[here] = color # white = 1
+        canvas.painted[here] = 1
+        direction = (direction + (1 if turn else -1)) % 4
+        x += dxy[direction][0]
+        y += dxy[direction][1]
+        here = canvas.index(x, y)
+    return canvas
+
+def print_panels(canvas):
+    render(canvas.lines())
 
 def main():
-    with open("day11.txt") as input_file:
-        ints = [int(x) for x in input_file.read().split(",")]
+    ints = load_program("day11.txt")
     panels = get_painted_panels(ints, 0)
     print("Part one solution: {}".format(len(panels)))
     print("Part two solution:")
     print_panels(get_painted_panels(ints, 1))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
+
+class TestCanvas(unittest.TestCase):
+    def test_canvas(self):
+        canvas = Canvas(width=2, height=2)
+        canvas.paint(0, 0, 1)
+        canvas.paint(0, 0, 0) # Repainting counts once.
+        canvas.paint(-3, 1, 1)
+        self.assertEqual((canvas.width, canvas.height), (4, 4))
+        canvas.paint(2, -2, 1)
+        canvas.paint(1, 5, 0)
+        self.assertEqual((canvas.width, canvas.height), (8, 16))
+        self.assertEqual(len(canvas), 4)
+        self.assertEqual(canvas[-3, 1], 1)
+        self.assertEqual(canvas[2, -2], 1)
+        self.assertEqual(canvas[0, 0], 0)
+        self.assertEqual(canvas[100, -100], 0)
+        lines = canvas.lines()
+        self.assertEqual(len(lines), 8)
+        self.assertEqual(lines[0], "      ")
+        self.assertEqual(lines[4], u"\u2588     ")
+        self.assertEqual(lines[7], u"     \u2588")
+        self.assertEqual(Canvas().lines(), [])
+
+    def test_robot(self):
+        # The moves from the puzzle description, ignoring the camera.
+        moves = [1,0, 0,0, 1,0, 1,0, 0,1, 1,0, 1,0]
+        ints = [v for move in moves for v in (104, move)] + [99]
+        canvas = Canvas()
+        self.assertIs(get_painted_panels(ints, 0, canvas=canvas), canvas)
+        self.assertEqual(len(canvas), 6)
+        self.assertEqual(canvas.lines(), [u"  \u2588", u"  \u2588",
+                                          u"\u2588\u2588 "])
@@ -1,45 +1,186 @@
-from collections import defaultdict
+from io import StringIO
+import sys
+import unittest
 
 from intcode import IntcodeComputer
+from intcode_cache import cached_run
+from intcode_loader import load_program
+from renderer import Renderer
+from renderer import render
 
-def get_move_score(output):
-    ball_x = None
-    paddle_x = None
-    score = None
-    for i in range(0, len(output), 3):
-        if output[i + 2] == 4:
-            ball_x = output[i]
-        elif output[i + 2] == 3:
-            paddle_x = output[i]
-        elif (output[i], output[i + 1]) == (-1, 0):
-            score = output[i + 2]
-    dx = paddle_x - ball_x if ball_x and paddle_x else None
-    move = None if not dx else -1 if dx > 0 else +1 if dx < 0 else 0
-    return move, score
+EMPTY, WALL, BLOCK, PADDLE, BALL = range(5)
+
+class Screen:
+    """Arcade screen kept as a grid of tiles, updated one draw at a time.
+
+    The grid starts at width x height and doubles in either dimension when
+    a tile lands past its edge. The ball, the paddle, the number of blocks
+    and the drawn extent are kept up to date as tiles change, and
+    on_ball(x, y) is called each time the ball is drawn.
+    """
+    def __init__(self, width=64, height=32, on_ball=None):
+        self.rows = [bytearray(width) for _ in range(height)]
+        self.width = width
+        self.score = None
+        self.ball = None # (x, y)
+        self.paddle = None # (x, y)
+        self.blocks = 0
+        self.extent = (0, 0) # One past the largest x and y drawn.
+        self.on_ball = on_ball
+
+    def draw(self, x, y, tile):
+        if (x, y) == (-1, 0):
+            self.score = tile
+            return
+        if x < 0 or y < 0:
+            raise ValueError("Invalid tile position ({}, {}).".format(x, y))
+        if x >= self.width or y >= len(self.rows):
+            self._grow(x, y)
+        row = self.rows[y]
+        self.blocks += (tile == BLOCK) - (row[x] == BLOCK)
+        row[x] = tile
+        if x >= self.extent[0] or y >= self.extent[1]:
+            self.extent = (max(self.extent[0], x + 1),
+                           max(self.extent[1], y + 1))
+        if tile == BALL:
+            self.ball = (x, y)
+            if self.on_ball is not None:
+                self.on_ball(x, y)
+        elif tile == PADDLE:
+            self.paddle = (x, y)
+
+    def draw_all(self, output):
+        """Draws a flat list of x, y, tile outputs."""
+        for i in range(0, len(output), 3):
+            self.draw(output[i], output[i + 1], output[i + 2])
+
+    def tile(self, x, y):
+        if 0 <= y < len(self.rows) and 0 <= x < self.width:
+            return self.rows[y][x]
+        return EMPTY
+
+    def lines(self):
+        """Returns the drawn area as one string of tile digits per row."""
+        width, height = self.extent
+        return ["".join(str(tile) if tile else " " for tile in row[:width])
+                for row in self.rows[:height]]
+
+    def _grow(self, x, y):
+        width = self.width
+        while width <= x:
+            width *= 2
+        if width != self.width:
+            for row in self.rows:
+                row.extend(bytes(width - self.width))
+            self.width = width
+        while len(self.rows) <= y:
+            self.rows.extend(bytearray(width) for _ in range(len(self.rows)))
+
+class AutoPlayer:
+    """Joystick that keeps the paddle under the ball.
+
+    It picks a new move only when the screen reports the ball has moved.
+    """
+    def __init__(self, screen):
+        self.screen = screen
+        self.move = 0 # Don't move the paddle until both are drawn.
+        screen.on_ball = self.ball_moved
+
+    def __call__(self):
+        return self.move
+
+    def ball_moved(self, ball_x, ball_y):
+        paddle = self.screen.paddle
+        if paddle is not None:
+            self.move = get_move(ball_x, paddle[0])
+
+def get_move(ball_x, paddle_x):
+    if ball_x is None or paddle_x is None:
+        return 0 # Don't move paddle until both are drawn.
+    return (ball_x > paddle_x) - (ball_x < paddle_x)
+
+def play(ints, screen=None, renderer=None):
+    """Plays the game to the end and returns the screen. With a renderer,
+    the screen is drawn each time the joystick is read, as often as the
+    renderer allows, and once more at the end."""
+    screen = screen or Screen()
+    joystick = AutoPlayer(screen)
+    if renderer is not None:
+        player = joystick
+        def joystick():
+            if renderer.due():
+                renderer.render(frame(screen))
+            return player()
+    draw = screen.draw
+    for x, y, tile in IntcodeComputer(ints).stream(joystick, group=3):
+        draw(x, y, tile)
+    if renderer is not None:
+        renderer.render(frame(screen), force=True)
+        renderer.close()
+    return screen
+
+def frame(screen):
+    return screen.lines() + ["Score: {}".format(screen.score)]
 
 def print_tiles(output):
-    tiles = defaultdict(int) # {(x,y): tile}
-    for i in range(0, len(output), 3):
-        tiles[(output[i], output[i + 1])] = output[i + 2]
-    xs, ys = zip(*tiles.keys())
-    for y in reversed(range(min(ys), max(ys) + 1)):
-        for x in range(min(xs), max(xs) + 1):
-            print(tiles[(x,y)] if tiles[(x,y)] else " ", end="")
-        print()
+    screen = Screen()
+    screen.draw_all(output)
+    # Largest y first, as the tiles have always been printed.
+    render(screen.lines()[::-1])
 
 def main():
-    with open("day13.txt") as input_file:
-        ints = [int(x) for x in input_file.read().split(",")]
-    output = IntcodeComputer(ints).run()
-    print("Part one solution: {}".format(output[2::3].count(2)))
+    ints = load_program("day13.txt")
+    screen = Screen()
+    screen.draw_all(cached_run(ints).outputs)
+    print("Part one solution: {}".format(screen.blocks))
 
     ints[0] = 2
-    computer = IntcodeComputer(ints, wait_for_input=True)
-    move = 0 # Don't move paddle to start.
-    while not computer.is_done():
-        output = computer.run(inputs=[move])
-        move, score = get_move_score(output)
-    print("Part two solution: {}".format(score))
+    renderer = Renderer(live=True) if "--watch" in sys.argv else None
+    print("Part two solution: {}".format(play(ints, renderer=renderer).score))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
+
+class TestScreen(unittest.TestCase):
+    def test_screen(self):
+        balls = []
+        screen = Screen(width=2, height=2, on_ball=lambda x, y:
+                        balls.append((x, y)))
+        screen.draw_all([1,2,3,6,5,4,-1,0,12345,0,0,2,1,0,2])
+        self.assertEqual(screen.score, 12345)
+        self.assertEqual(screen.paddle, (1, 2))
+        self.assertEqual(screen.ball, (6, 5))
+        self.assertEqual(balls, [(6, 5)])
+        self.assertEqual(screen.blocks, 2)
+        self.assertEqual(screen.extent, (7, 6))
+        self.assertEqual((screen.width, len(screen.rows)), (8, 8))
+        screen.draw(0, 0, EMPTY) # Breaking a block.
+        screen.draw(0, 0, EMPTY)
+        self.assertEqual(screen.blocks, 1)
+        self.assertEqual(screen.tile(6, 5), BALL)
+        self.assertEqual(screen.tile(100, 100), EMPTY)
+        self.assertEqual(screen.lines()[2], " 3     ")
+        self.assertRaises(ValueError, screen.draw, -2, 0, WALL)
+
+    def test_autoplayer(self):
+        screen = Screen()
+        player = AutoPlayer(screen)
+        self.assertEqual(player(), 0)
+        screen.draw(5, 20, PADDLE)
+        screen.draw(3, 10, BALL)
+        self.assertEqual(player(), -1)
+        screen.draw(5, 11, BALL)
+        self.assertEqual(player(), 0)
+        screen.draw(9, 12, BALL)
+        self.assertEqual(player(), 1)
+
+    def test_play_rendered(self):
+        out = StringIO()
+        renderer = Renderer(out, live=True, max_fps=0)
+        # Draws a ball, reads the joystick, then sets the score.
+        ints = [104,1,104,0,104,4,3,20,104,-1,104,0,104,7,99]
+        screen = play(ints, renderer=renderer)
+        self.assertEqual(screen.score, 7)
+        self.assertEqual(renderer.frames, 2)
+        self.assertEqual(out.getvalue(), "\x1b[2J\x1b[H 4\nScore: None"
+                         "\x1b[2;8H7\x1b[2;9H\x1b[K\x1b[3;1H\n")
@@ -1,10 +1,177 @@
-from collections import defaultdict
+from collections import Counter
+from collections import deque
 from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
 from enum import IntEnum
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import json
+import operator
+import os
+import sys
 import unittest
+import zlib
+
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+class Memory:
+    """Dense pages of cells from address 0, with far addresses kept sparse.
+
+    Pages are copy-on-write: fork() shares every page with the new memory, and
+    each side copies a page only when it first writes to it.
+    """
+    MAX_GAP = 4096 # Writes further than this past the dense end stay sparse.
+
+    def __init__(self, ints=()):
+        ints = list(ints)
+        ints.extend([0] * (-len(ints) % PAGE_SIZE))
+        self.pages = [ints[i:i + PAGE_SIZE]
+                      for i in range(0, len(ints), PAGE_SIZE)]
+        self.sparse = {} # {address: value} for addresses past the dense end.
+        self._owned = set(range(len(self.pages))) # Pages safe to write.
+        self._pages_shared = False # Page table list is shared with a fork.
+        self._sparse_shared = False
+
+    def __len__(self):
+        return len(self.pages) * PAGE_SIZE + len(self.sparse)
+
+    def footprint(self):
+        """Approximate size in bytes of the containers this memory owns."""
+        size = sys.getsizeof(self.pages)
+        size += sum(sys.getsizeof(self.pages[page]) for page in self._owned)
+        if not self._sparse_shared:
+            size += sys.getsizeof(self.sparse)
+        return size
+
+    def fork(self):
+        """Returns a copy of the memory that shares all pages until written."""
+        other = Memory()
+        other.pages = self.pages
+        other.sparse = self.sparse
+        other._pages_shared = other._sparse_shared = True
+        self._owned = set()
+        self._pages_shared = self._sparse_shared = True
+        return other
+
+    def read(self, address):
+        try:
+            if address >= 0:
+                return self.pages[address >> PAGE_BITS][address & PAGE_MASK]
+        except IndexError:
+            return self.sparse.get(address, 0)
+        raise ValueError("Invalid negative address {}.".format(address))
+
+    def write(self, address, value):
+        page = address >> PAGE_BITS
+        if page in self._owned:
+            self.pages[page][address & PAGE_MASK] = value
+        elif address < 0:
+            raise ValueError("Invalid negative address {}.".format(address))
+        elif page < len(self.pages):
+            self._own_page(page)
+            self.pages[page][address & PAGE_MASK] = value
+        else:
+            self._write_past_end(address, value)
+
+    def _own_pages(self):
+        if self._pages_shared:
+            self.pages = list(self.pages)
+            self._pages_shared = False
+
+    def _own_sparse(self):
+        if self._sparse_shared:
+            self.sparse = dict(self.sparse)
+            self._sparse_shared = False
+
+    def _own_page(self, page):
+        self._own_pages()
+        self.pages[page] = list(self.pages[page])
+        self._owned.add(page)
+
+    def _write_past_end(self, address, value):
+        end = len(self.pages) * PAGE_SIZE
+        self._own_sparse()
+        if address - end > self.MAX_GAP:
+            self.sparse[address] = value
+            return
+        self._own_pages()
+        while len(self.pages) * PAGE_SIZE <= address:
+            self._owned.add(len(self.pages))
+            self.pages.append([0] * PAGE_SIZE)
+        self.sparse[address] = value
+        # Move sparse cells now covered by the dense pages into them.
+        new_end = len(self.pages) * PAGE_SIZE
+        for other in [a for a in self.sparse if a < new_end]:
+            self.pages[other >> PAGE_BITS][other & PAGE_MASK] = (
+                self.sparse.pop(other))
+
+class Profile:
+    """Execution statistics collected by IntcodeComputer(profile=True)."""
+    def __init__(self):
+        self.instructions = 0
+        self.opcodes = Counter() # {opcode name: executions}
+        self.ips = Counter() # {ip: executions}
+        self.ip_opcodes = {} # {ip: name of the opcode last executed there}
+        self.jumps = Counter() # {(ip, target): times taken}
+        self.outputs = 0
+        self.elapsed = 0.0 # Seconds spent in run/stream.
+        self.input_wait = 0.0 # Seconds reading or waiting for input.
+        self._waiting_since = None
+
+    def record(self, ip, name, next_ip, length):
+        self.instructions += 1
+        self.opcodes[name] += 1
+        self.ips[ip] += 1
+        self.ip_opcodes[ip] = name
+        if next_ip != ip + length and name != "HALT":
+            self.jumps[(ip, next_ip)] += 1
+
+    def outputs_per_second(self):
+        return self.outputs / self.elapsed if self.elapsed else 0.0
+
+    def hot_loops(self):
+        """Returns (start, end, instructions) for each loop, hottest first.
+
+        A loop is the address range covered by a backward jump, and
+        instructions counts every execution of an ip in that range.
+        """
+        loops = {(target, ip) for ip, target in self.jumps if target <= ip}
+        return sorted(((start, end, sum(count for ip, count in self.ips.items()
+                                        if start <= ip <= end))
+                       for start, end in loops),
+                      key=lambda loop: (-loop[2], loop[0]))
+
+    def report(self, top=5, width=40):
+        """Returns a text report of the opcode mix and the hottest loops."""
+        total = self.instructions or 1
+        bar = lambda count: "\u2588" * round(width * count / total)
+        lines = ["{} instructions, {} outputs in {:.3f} s ({:.0f} outputs/s), "
+                 "{:.3f} s on input".format(
+                     self.instructions, self.outputs, self.elapsed,
+                     self.outputs_per_second(), self.input_wait),
+                 "Opcodes:"]
+        for name, count in self.opcodes.most_common():
+            lines.append("  {:<14}{:>12} {:6.1%}".format(name, count,
+                                                         count / total))
+        lines.append("Hot loops:")
+        for start, end, count in self.hot_loops()[:top]:
+            lines.append("  {:>6}-{:<6}{:>12} {:6.1%} {}".format(
+                         start, end, count, count / total, bar(count)))
+            hottest = sorted((ip for ip in self.ips if start <= ip <= end),
+                             key=lambda ip: -self.ips[ip])
+            for ip in hottest[:top]:
+                lines.append("    {:>6} {:<14}{:>8} {:6.1%} {}".format(
+                             ip, self.ip_opcodes[ip], self.ips[ip],
+                             self.ips[ip] / total, bar(self.ips[ip])))
+        return "\n".join(lines)
 
 class IntcodeComputer:
     Opcode = namedtuple("Opcode", ("name", "params", "writes"))
+    Snapshot = namedtuple("Snapshot", ("ip", "base", "done", "memory"))
     _OPCODES = {
         1: Opcode("ADD", 3, 1),
         2: Opcode("MULTIPLY", 3, 1),
@@ -18,102 +185,561 @@ class IntcodeComputer:
         99: Opcode("HALT", 0, 0)
     }
 
+    _PARSED = {} # {instruction: (opcode, modes, relative)} for valid ones.
+
+    CHECKPOINT_VERSION = 1
+
+    # Results of the opcodes that can be fused with a following jump.
+    _FUSED_OPS = {
+        1: operator.add,
+        2: operator.mul,
+        7: lambda a, b: 1 if a < b else 0,
+        8: lambda a, b: 1 if a == b else 0,
+    }
+
+    # Handler return values that interrupt the run loop.
+    _STOP = 1
+    _FLUSH = 2
+
     class Mode(IntEnum):
         POSITION = 0
         IMMEDIATE = 1
         RELATIVE = 2
 
-    def __init__(self, ints, wait_for_input=False):
-        self.ints = defaultdict(int, enumerate(ints))
+    def __init__(self, ints, wait_for_input=False, profile=False):
+        self._set_memory(Memory(ints))
+        self.stats = Profile() if profile else None
         self.ip = 0 # Instruction pointer.
         self.base = 0 # Used in RELATIVE mode.
         self.wait_for_input = wait_for_input
         self.done = False
+        self._handlers = {
+            1: self._add,
+            2: self._multiply,
+            3: self._input,
+            4: self._output,
+            5: self._jump_if_true,
+            6: self._jump_if_false,
+            7: self._less_than,
+            8: self._equals,
+            9: self._adjust_base,
+            99: self._halt,
+        }
+        self.pending_inputs = deque() # Inputs given to run() not yet read.
+        self.out_of_budget = False # Whether the last run hit its budget.
+        self.steps = 0 # Instructions run by the last budgeted stream.
+        self._next_input = None
+        self._inputs = ()
+        self._group = 1
+        self._outputs = [] # Outputs of the group being collected.
 
     def is_done(self):
         return self.done
 
-    def run(self, inputs=[], verbose=False):
+    def snapshot(self):
+        """Captures the current state. Memory pages are shared until written."""
+        return self.Snapshot(self.ip, self.base, self.done, self.memory.fork())
+
+    def restore(self, snapshot):
+        self.ip, self.base, self.done, memory = snapshot
+        self._set_memory(memory.fork())
+        self.pending_inputs.clear()
+
+    def fork(self):
+        """Returns a computer that continues independently from this state."""
+        other = type(self)((), self.wait_for_input, self.stats is not None)
+        other.restore(self.snapshot())
+        return other
+
+    def _set_memory(self, memory):
+        self.memory = memory
+        self._read = memory.read
+        # Decoded instructions are cached per address and dropped when written.
+        self._decoded = {} # {ip: (handler, pos, relative, length)}
+        self._decoded_at = {} # {address: {ip of each instruction covering it}}
+
+    def run(self, inputs=[], verbose=False, budget=None):
+        """Runs the program and returns its outputs. Inputs left unread when
+        the budget runs out are kept for the next run()."""
+        self.pending_inputs.extend(inputs)
+        outputs = list(self.stream(self.pending_inputs, verbose=verbose,
+                                   budget=budget))
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def stream(self, inputs=(), group=1, verbose=False, budget=None):
+        """Runs the program, yielding outputs as soon as they are produced.
+
+        inputs may be any iterable (read lazily), a deque (which the caller
+        can keep appending to) or a callable returning the next input, or
+        None if there is none. Outputs are yielded one at a time, or as tuples
+        of group values. When input runs out and wait_for_input is set, the
+        stream ends with the computer paused on the INPUT instruction, and a
+        later stream() or run() call resumes it. Likewise, with a budget the
+        stream ends after that many instructions and sets out_of_budget, and
+        steps counts the instructions run so far.
+        """
+        self._next_input = self._input_reader(inputs)
+        self._inputs = inputs
+        self._group = group
+        self.out_of_budget = False
+        self.steps = 0
+        if verbose or self.stats is not None or budget is not None:
+            return self._profiled_loop(group, verbose, budget)
+        return self._loop(group)
+
+    def run_checkpointed(self, path, inputs=[], every=10**6):
+        """Runs like run(), saving a checkpoint to path every `every`
+        instructions and when the run returns."""
+        self.pending_inputs.extend(inputs)
         outputs = []
         while True:
-            opcode, modes = self._parse_instruction(self.ints[self.ip])
-            op = self._OPCODES[opcode]
-            pos = []
-            for j, mode in enumerate(modes):
-                if mode == self.Mode.POSITION:
-                    pos.append(self.ints[self.ip + 1 + j])
-                elif mode == self.Mode.IMMEDIATE:
-                    pos.append(self.ip + 1 + j)
-                elif mode == self.Mode.RELATIVE:
-                    pos.append(self.base + self.ints[self.ip + 1 + j])
-            if verbose:
-                i_max = self.ip + len(modes)
-                print("Intcode: {}\n"
-                      "ip: {}, ins: {}, base: {}, inputs: {}, op: {}, "
-                       "modes: {}, pos: {} val: {}\n"
-                       "output: {}\n-----"
-                      .format(list(self.ints.values())[0:i_max+1], self.ip,
-                              self.ints[self.ip], self.base, inputs, op.name,
-                              modes, pos, [self.ints[i] for i in pos], outputs))
-            if op.name == "HALT":
-                self.done = True
+            outputs.extend(self.stream(self.pending_inputs, budget=every))
+            self.checkpoint(path, outputs)
+            if not self.out_of_budget:
                 break
-            elif op.name == "ADD":
-                self.ints[pos[2]] = self.ints[pos[0]] + self.ints[pos[1]]
-            elif op.name == "MULTIPLY":
-                self.ints[pos[2]] = self.ints[pos[0]] * self.ints[pos[1]]
-            elif op.name == "INPUT":
-                if not inputs:
-                    if self.wait_for_input:
-                        break # Wait for input, so don't increment ip.
-                    else:
-                        raise ValueError("Input instruction missing input.")
-                self.ints[pos[0]] = inputs.pop(0)
-            elif op.name == "OUTPUT":
-                outputs.append(self.ints[pos[0]])
-            elif op.name == "JUMP_IF_TRUE":
-                if (self.ints[pos[0]] != 0):
-                    self.ip = self.ints[pos[1]]
-                    continue
-            elif op.name == "JUMP_IF_FALSE":
-                if (self.ints[pos[0]] == 0):
-                    self.ip = self.ints[pos[1]]
-                    continue
-            elif op.name == "LESS_THAN":
-                if self.ints[pos[0]] < self.ints[pos[1]]:
-                    self.ints[pos[2]] = 1
-                else:
-                    self.ints[pos[2]] = 0
-            elif op.name == "EQUALS":
-                if self.ints[pos[0]] == self.ints[pos[1]]:
-                    self.ints[pos[2]] = 1
-                else:
-                    self.ints[pos[2]] = 0
-            elif op.name == "ADJUST_BASE":
-                self.base += self.ints[pos[0]]
-            self.ip += op.params + 1
         return outputs[0] if len(outputs) == 1 else outputs
 
-    def _parse_instruction(self, instruction):
+    def checkpoint(self, path, outputs=()):
+        """Saves the state, pending inputs and outputs to path. outputs are
+        any the caller has received but not yet used, returned by resume()."""
+        cells = [value for page in self.memory.pages for value in page]
+        while cells and not cells[-1]:
+            cells.pop()
+        state = {
+            "version": self.CHECKPOINT_VERSION,
+            "ip": self.ip,
+            "base": self.base,
+            "done": self.done,
+            "wait_for_input": self.wait_for_input,
+            "pending_inputs": list(self.pending_inputs),
+            "group": list(self._outputs), # Outputs of a partial group.
+            "outputs": list(outputs),
+            "cells": cells,
+            "sparse": sorted(self.memory.sparse.items()),
+        }
+        data = zlib.compress(json.dumps(state, separators=(",", ":")).encode())
+        # Written beside the checkpoint and renamed, so a crash mid-write
+        # leaves the previous checkpoint intact.
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp, "wb") as checkpoint_file:
+            checkpoint_file.write(data)
+        os.replace(temp, path)
+
+    @classmethod
+    def resume(cls, path):
+        """Returns the computer saved in a checkpoint and its saved outputs."""
+        with open(path, "rb") as checkpoint_file:
+            state = json.loads(zlib.decompress(checkpoint_file.read()))
+        if state.get("version") != cls.CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version {}.".format(
+                             state.get("version")))
+        computer = cls(state["cells"], state["wait_for_input"])
+        computer.memory.sparse.update(
+            (address, value) for address, value in state["sparse"])
+        computer.ip = state["ip"]
+        computer.base = state["base"]
+        computer.done = state["done"]
+        computer.pending_inputs.extend(state["pending_inputs"])
+        computer._outputs.extend(state["group"])
+        return computer, state["outputs"]
+
+    def _loop(self, group):
+        outputs = self._outputs
+        FLUSH = self._FLUSH
+        while True:
+            instruction = (self._decoded.get(self.ip) or
+                           self._decode_fused(self.ip))
+            handler, pos, relative, _ = instruction
+            if relative:
+                base = self.base
+                pos = [p + base if r else p for p, r in zip(pos, relative)]
+            signal = handler(pos)
+            if signal:
+                if signal is not FLUSH:
+                    break
+                value = outputs[0] if group == 1 else tuple(outputs)
+                outputs.clear() # Before yielding, in case the stream is dropped.
+                yield value
+        if self.done and outputs:
+            value = tuple(outputs) # Program halted part way through a group.
+            outputs.clear()
+            yield value
+
+    def _profiled_loop(self, group, verbose, budget=None):
+        # Same as _loop, but tracing, collecting stats and/or stopping after
+        # budget instructions.
+        stats = self.stats
+        outputs = self._outputs
+        FLUSH = self._FLUSH
+        names = {handler: self._OPCODES[opcode].name
+                 for opcode, handler in self._handlers.items()}
+        if stats is not None:
+            next_input = self._next_input
+            def timed_input():
+                start = perf_counter()
+                try:
+                    return next_input()
+                finally:
+                    stats.input_wait += perf_counter() - start
+            self._next_input = timed_input
+            if stats._waiting_since is not None:
+                stats.input_wait += perf_counter() - stats._waiting_since
+                stats._waiting_since = None
+            start = perf_counter()
+        steps = 0
+        while True:
+            if budget is not None:
+                if steps == budget:
+                    self.out_of_budget = True
+                    break
+                steps += 1
+            ip = self.ip
+            handler, pos, relative, length = (self._decoded.get(ip) or
+                                              self._decode(ip))
+            if handler not in names: # Superinstruction; run it unfused.
+                self._drop_decoded(ip)
+                handler, pos, relative, length = self._decode(ip)
+            if relative:
+                base = self.base
+                pos = [p + base if r else p for p, r in zip(pos, relative)]
+            if verbose:
+                self._trace(pos)
+            signal = handler(pos)
+            if stats is not None:
+                if signal is self._STOP and not self.done:
+                    stats._waiting_since = perf_counter() # Waiting for input.
+                else:
+                    stats.record(ip, names[handler], self.ip, length)
+            if signal:
+                if signal is not FLUSH:
+                    break
+                if stats is not None:
+                    stats.outputs += 1 if group == 1 else len(outputs)
+                    stats.elapsed += perf_counter() - start
+                value = outputs[0] if group == 1 else tuple(outputs)
+                outputs.clear()
+                self.steps = steps
+                yield value
+                if stats is not None:
+                    start = perf_counter()
+        self.steps = steps
+        if stats is not None:
+            stats.outputs += len(outputs)
+            stats.elapsed += perf_counter() - start
+        if self.done and outputs:
+            value = tuple(outputs) # Program halted part way through a group.
+            outputs.clear()
+            yield value
+
+    @staticmethod
+    def _input_reader(inputs):
+        if callable(inputs):
+            return inputs
+        if isinstance(inputs, deque):
+            return inputs.popleft
+        return iter(inputs).__next__
+
+    def _decode(self, ip):
+        opcode, modes, relative = self._parse_cached(self._read(ip))
+        pos = []
+        for j, mode in enumerate(modes, ip + 1):
+            pos.append(j if mode == self.Mode.IMMEDIATE else self._read(j))
+        length = len(modes) + 1
+        instruction = (self._handlers[opcode], tuple(pos), relative, length)
+        self._decoded[ip] = instruction
+        decoded_at = self._decoded_at
+        for address in range(ip, ip + length):
+            if address in decoded_at:
+                decoded_at[address].add(ip)
+            else:
+                decoded_at[address] = {ip}
+        return instruction
+
+    def _write(self, address, value):
+        self.memory.write(address, value)
+        if address in self._decoded_at:
+            self._invalidate(address)
+
+    def _invalidate(self, address):
+        for ip in list(self._decoded_at[address]):
+            self._drop_decoded(ip)
+
+    def _drop_decoded(self, ip):
+        _, _, _, length = self._decoded.pop(ip)
+        for address in range(ip, ip + length):
+            self._decoded_at[address].discard(ip)
+            if not self._decoded_at[address]:
+                del self._decoded_at[address]
+
+    def _match_fusion(self, ip):
+        # Returns the length of the superinstruction starting at ip, if any:
+        # an arithmetic or compare result tested by the next instruction's
+        # jump (7 cells), or an ADD of 0 or MULTIPLY by 1 (a move, 4 cells).
+        read = self._read
+        word = read(ip)
+        if word % 100 not in self._FUSED_OPS:
+            return None
+        try:
+            _, modes, _ = self._parse_cached(word)
+        except ValueError:
+            return None
+        jump_word = read(ip + 4)
+        if jump_word % 100 in (5, 6) and read(ip + 5) == read(ip + 3):
+            try:
+                _, jump_modes, _ = self._parse_cached(jump_word)
+            except ValueError:
+                jump_modes = None
+            if jump_modes and jump_modes[0] == modes[2] and (
+                    modes[2] == self.Mode.RELATIVE
+                    or not ip <= read(ip + 3) < ip + 7):
+                return 7
+        identity = {1: 0, 2: 1}.get(word % 100)
+        if identity is not None and any(
+                mode == self.Mode.IMMEDIATE and read(ip + 1 + j) == identity
+                for j, mode in enumerate(modes[:2])):
+            return 4
+        return None
+
+    def _decode_fused(self, ip):
+        # Decodes the instruction at ip, as a superinstruction if the cells
+        # there match one. Like any decoded instruction, it is dropped when
+        # one of its cells is written, and matched again on the next decode.
+        length = self._match_fusion(ip)
+        if length is None:
+            return self._decode(ip)
+        _, pos, relative, _ = self._decode(ip)
+        word = self._read(ip)
+        opcode = word % 100
+        if length == 4:
+            # The operand that isn't the identity is the source.
+            modes = self._parse_cached(word)[1]
+            identity = 1 if opcode == 2 else 0
+            source = 1 if (modes[0] == self.Mode.IMMEDIATE
+                           and self._read(ip + 1) == identity) else 0
+            pos = (pos[source], pos[2])
+            relative = relative and (relative[source], relative[2])
+            handler = self._move
+        else:
+            _, jump_pos, jump_relative, _ = self._decode(ip + 4)
+            pos = pos + jump_pos[1:]
+            if relative or jump_relative:
+                relative = ((relative or (False,) * 3) +
+                            (jump_relative or (False,) * 2)[1:])
+            handler = self._fused_jump(ip, opcode, self._read(ip + 4) % 100)
+        instruction = (handler, pos, relative, length)
+        self._decoded[ip] = instruction
+        for address in range(ip, ip + length):
+            self._decoded_at.setdefault(address, set()).add(ip)
+        return instruction
+
+    def _move(self, pos):
+        self._write(pos[1], self._read(pos[0]))
+        self.ip += 4
+
+    def _fused_jump(self, ip, opcode, jump):
+        # Returns the handler for an opcode writing a cell followed by a jump
+        # testing it. pos is (a, b, cell, jump target).
+        end = ip + 7
+        compute = self._FUSED_OPS[opcode]
+        write = self._write
+        if_true = jump == 5
+        def fused_jump(pos):
+            read = self._read
+            cell = pos[2]
+            value = compute(read(pos[0]), read(pos[1]))
+            write(cell, value)
+            if ip <= cell < end:
+                self.ip = ip + 4 # Wrote into the jump; decode it again.
+            elif (value != 0) is if_true:
+                self.ip = read(pos[3])
+            else:
+                self.ip = end
+        return fused_jump
+
+    def _trace(self, pos):
+        opcode, modes = self._parse_instruction(self._read(self.ip))
+        i_max = self.ip + len(modes)
+        print("Intcode: {}\n"
+              "ip: {}, ins: {}, base: {}, inputs: {}, op: {}, "
+               "modes: {}, pos: {} val: {}\n"
+               "output: {}\n-----"
+              .format([self._read(i) for i in range(i_max + 1)], self.ip,
+                      self._read(self.ip), self.base, self._inputs,
+                      self._OPCODES[opcode].name, modes, list(pos),
+                      [self._read(i) for i in pos], self._outputs))
+
+    def _add(self, pos):
+        self._write(pos[2], self._read(pos[0]) + self._read(pos[1]))
+        self.ip += 4
+
+    def _multiply(self, pos):
+        self._write(pos[2], self._read(pos[0]) * self._read(pos[1]))
+        self.ip += 4
+
+    def _read_input(self):
+        # Returns the next input, or None if there is none available.
+        try:
+            return self._next_input()
+        except (IndexError, StopIteration):
+            return None
+
+    def _input(self, pos):
+        value = self._read_input()
+        if value is None:
+            if self.wait_for_input:
+                return self._STOP # Wait for input, so don't increment ip.
+            else:
+                raise ValueError("Input instruction missing input.")
+        self._write(pos[0], value)
+        self.ip += 2
+
+    def _output(self, pos):
+        self._outputs.append(self._read(pos[0]))
+        self.ip += 2
+        if len(self._outputs) == self._group:
+            return self._FLUSH
+
+    def _jump_if_true(self, pos):
+        if self._read(pos[0]) != 0:
+            self.ip = self._read(pos[1])
+        else:
+            self.ip += 3
+
+    def _jump_if_false(self, pos):
+        if self._read(pos[0]) == 0:
+            self.ip = self._read(pos[1])
+        else:
+            self.ip += 3
+
+    def _less_than(self, pos):
+        read = self._read
+        self._write(pos[2], 1 if read(pos[0]) < read(pos[1]) else 0)
+        self.ip += 4
+
+    def _equals(self, pos):
+        read = self._read
+        self._write(pos[2], 1 if read(pos[0]) == read(pos[1]) else 0)
+        self.ip += 4
+
+    def _adjust_base(self, pos):
+        self.base += self._read(pos[0])
+        self.ip += 2
+
+    def _halt(self, pos):
+        self.done = True
+        return self._STOP
+
+    @classmethod
+    def _parse_cached(cls, instruction):
+        # _parse_instruction memoized in _PARSED, with modes as a tuple and
+        # which of them are relative (or None if none are).
+        parsed = cls._PARSED.get(instruction)
+        if parsed is None:
+            opcode, modes = cls._parse_instruction(instruction)
+            relative = tuple(mode == cls.Mode.RELATIVE for mode in modes)
+            parsed = (opcode, tuple(modes), relative if any(relative) else None)
+            cls._PARSED[instruction] = parsed
+        return parsed
+
+    @classmethod
+    def _parse_instruction(cls, instruction):
         opcode = instruction % 100
         digits = instruction // 100
         modes = []
-        if opcode not in self._OPCODES:
+        if opcode not in cls._OPCODES:
             raise ValueError("Instruction {} has invalid opcode: {}.".format(
                              instruction, opcode))
-        op  = self._OPCODES[opcode]
+        op  = cls._OPCODES[opcode]
         while len(modes) < op.params:
             modes.append(digits % 10)
             digits //= 10
-        if digits != 0 or any(mode > self.Mode.RELATIVE for mode in modes):
+        if digits != 0 or any(mode > cls.Mode.RELATIVE for mode in modes):
             raise ValueError("Instruction {} has invalid parameter modes."
                              .format(instruction))
-        if op.writes and any(mode == self.Mode.IMMEDIATE
+        if op.writes and any(mode == cls.Mode.IMMEDIATE
                              for mode in modes[-op.writes:]):
             raise ValueError("Instruction {} has write param immediate mode."
                              .format(instruction))
         return opcode, modes
 
+RunResult = namedtuple("RunResult", ("index", "outputs", "cells"))
+
+_worker_snapshot = None # Program image shared by every run in a worker.
+
+def _init_worker(ints):
+    global _worker_snapshot
+    _worker_snapshot = IntcodeComputer.Snapshot(0, 0, False, Memory(ints))
+
+def _run_tasks(tasks, read):
+    results = []
+    computer = IntcodeComputer(())
+    for index, inputs, patches in tasks:
+        computer.restore(_worker_snapshot)
+        for address, value in patches.items():
+            computer.memory.write(address, value)
+        outputs = computer.run(inputs)
+        cells = tuple(computer.memory.read(address) for address in read)
+        results.append(RunResult(index, outputs, cells))
+    return results
+
+def run_many(ints, input_sets, patches=None, read=(), workers=None,
+             until=None, reducer=None, chunksize=64):
+    """Runs the program once per input set, spread across a process pool.
+
+    Each worker receives the program once and forks it for every run.
+    patches optionally gives a {address: value} dict per run to apply before
+    running it, and read lists addresses whose final values are returned.
+    Each run produces a RunResult(index, outputs, cells), where outputs is
+    shaped like IntcodeComputer.run's return value.
+
+    By default returns all results in input order. With until, returns the
+    first result to complete for which until(result) is true (or None) and
+    cancels the remaining runs. With reducer, returns all results combined
+    by reducer(result, result) in completion order.
+    """
+    input_sets = list(input_sets)
+    if patches is None:
+        patches = [{}] * len(input_sets)
+    tasks = list(zip(range(len(input_sets)), input_sets, patches))
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+    results = []
+    reduced = None
+    for chunk_results in _run_chunks(ints, chunks, read, workers):
+        for result in chunk_results:
+            if until is not None:
+                if until(result):
+                    return result
+            elif reducer is not None:
+                reduced = result if reduced is None else reducer(reduced, result)
+            else:
+                results.append(result)
+    if until is not None:
+        return None
+    if reducer is not None:
+        return reduced
+    return sorted(results, key=lambda result: result.index)
+
+def _run_chunks(ints, chunks, read, workers):
+    # Yields each chunk's results as it completes. Closing the generator
+    # early cancels the chunks that haven't started.
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        _init_worker(ints)
+        for chunk in chunks:
+            yield _run_tasks(chunk, read)
+        return
+    executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                   initargs=(ints,))
+    try:
+        pending = {executor.submit(_run_tasks, chunk, read)
+                   for chunk in chunks}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
 class TestIntcodeComputer(unittest.TestCase):
     def test_intcode_basic(self):
         self.assertEqual(IntcodeComputer([99]).run(), [])
@@ -165,6 +791,133 @@ class TestIntcodeComputer(unittest.TestCase):
         c.run([5])
         self.assertTrue(c.is_done()) # Received input.
 
+    def test_intcode_self_modifying(self):
+        # Instruction at 0 is rewritten after it was decoded and run once.
+        ints = [104,7,1101,0,9,1,1005,17,16,1101,1,0,17,1105,1,0,99,0]
+        self.assertEqual(IntcodeComputer(ints).run(), [7, 9])
+        # Opcode rewritten from OUTPUT to ADJUST_BASE.
+        ints = [4,0,1101,0,9,0,1005,17,16,1101,1,0,17,1105,1,0,99,0]
+        self.assertEqual(IntcodeComputer(ints).run(), 4)
+
+    def test_intcode_stream(self):
+        echo_twice = [3,9,4,9,4,9,1105,1,0,0]
+        c = IntcodeComputer(echo_twice, wait_for_input=True)
+        self.assertEqual(list(c.stream(iter([1, 2]))), [1, 1, 2, 2])
+        self.assertFalse(c.is_done()) # Paused on input.
+        inputs = deque([3])
+        stream = c.stream(inputs, group=2)
+        self.assertEqual(next(stream), (3, 3))
+        inputs.append(4)
+        self.assertEqual(next(stream), (4, 4))
+        self.assertEqual(list(stream), [])
+        values = iter([5, 6])
+        self.assertEqual(list(c.stream(lambda: next(values, None))),
+                         [5, 5, 6, 6])
+        # Outputs are produced lazily, so a callback sees the latest state.
+        count_up = [3,7,4,7,1105,1,0,0]
+        c = IntcodeComputer(count_up)
+        last = [0]
+        for value in c.stream(lambda: last[0] + 1):
+            last[0] = value
+            if value == 3:
+                break
+        self.assertEqual(last[0], 3)
+
+    def test_intcode_stream_abandoned(self):
+        # Outputs already yielded aren't repeated after a stream is dropped.
+        c = IntcodeComputer([104,1,104,2,104,3,99])
+        stream = c.stream()
+        self.assertEqual(next(stream), 1)
+        del stream
+        self.assertEqual(c.run(), [2, 3])
+        c = IntcodeComputer([104,1,104,2,104,3,104,4,99])
+        for value in c.stream(group=2):
+            break
+        self.assertEqual(list(c.stream(group=2)), [(3, 4)])
+        c = IntcodeComputer([104,1,104,2,99], profile=True)
+        for value in c.stream():
+            break
+        self.assertEqual(c.run(), 2)
+
+    def test_intcode_stream_halt_mid_group(self):
+        self.assertEqual(list(IntcodeComputer([104,1,104,2,104,3,99])
+                              .stream(group=2)), [(1, 2), (3,)])
+
+    def test_intcode_snapshot(self):
+        # Adds each input to a running total and outputs it.
+        accumulate = [3,11,1,11,12,12,4,12,1105,1,0,0,0]
+        c = IntcodeComputer(accumulate, wait_for_input=True)
+        self.assertEqual(c.run([5]), 5)
+        snapshot = c.snapshot()
+        self.assertEqual(c.run([2]), 7)
+        fork = c.fork()
+        self.assertEqual(c.run([1]), 8)
+        self.assertEqual(fork.run([10]), 17)
+        c.restore(snapshot)
+        self.assertEqual(c.run([1]), 6)
+        c.restore(snapshot) # Snapshots can be restored more than once.
+        self.assertEqual(c.run([3]), 8)
+        self.assertEqual(fork.run([10]), 27)
+        halted = IntcodeComputer([99])
+        halted.run()
+        self.assertTrue(halted.fork().is_done())
+
+    def test_intcode_budget(self):
+        countdown = [104,5,1001,1,-1,1,1005,1,0,99]
+        c = IntcodeComputer(countdown)
+        self.assertEqual(c.run(budget=4), [5, 4])
+        self.assertTrue(c.out_of_budget)
+        self.assertEqual(c.steps, 4)
+        self.assertEqual(c.run(budget=6), [3, 2])
+        self.assertEqual(c.run(budget=100), 1)
+        self.assertEqual(c.steps, 6) # Including the HALT.
+        self.assertFalse(c.out_of_budget)
+        self.assertTrue(c.is_done())
+        # An infinite loop returns control with its state intact.
+        c = IntcodeComputer([1105,1,0])
+        self.assertEqual(c.run(budget=1000), [])
+        self.assertTrue(c.out_of_budget)
+        self.assertFalse(c.is_done())
+        # Inputs not read yet are kept for the next run.
+        echo_twice = [3,9,4,9,4,9,1105,1,0,0]
+        c = IntcodeComputer(echo_twice, wait_for_input=True)
+        self.assertEqual(c.run([1, 2, 3], budget=3), [1, 1])
+        self.assertEqual(list(c.pending_inputs), [2, 3])
+        self.assertEqual(c.run([4]), [2, 2, 3, 3, 4, 4])
+        self.assertFalse(c.out_of_budget)
+        self.assertEqual(list(IntcodeComputer([104,1,104,2,99])
+                              .stream(group=2, budget=1)), [])
+
+    def test_intcode_checkpoint(self):
+        path = os.path.join(self.enterContext(TemporaryDirectory()), "ckpt")
+        quine = [109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99]
+        c = IntcodeComputer(quine)
+        outputs = c.run(budget=30)
+        c.checkpoint(path, outputs)
+        resumed, saved = IntcodeComputer.resume(path)
+        self.assertEqual(saved, outputs)
+        self.assertEqual(saved + resumed.run(), quine)
+        # Periodic checkpoints, including far memory, inputs and output groups.
+        ints = [3,10**9,3,20,104,7,4,10**9,1105,1,0]
+        c = IntcodeComputer(ints, wait_for_input=True)
+        self.assertEqual(c.run_checkpointed(path, [2**70, 8], every=3),
+                         [7, 2**70])
+        resumed, saved = IntcodeComputer.resume(path)
+        self.assertEqual(saved, [7, 2**70])
+        self.assertEqual(resumed.memory.read(10**9), 2**70)
+        self.assertEqual(resumed.run([5, 6]), [7, 5])
+        self.assertFalse(resumed.is_done()) # Waiting for input again.
+        c = IntcodeComputer([104,1,104,2,104,3,99])
+        stream = c.stream(group=2, budget=3)
+        self.assertEqual(list(stream), [(1, 2)])
+        c.checkpoint(path)
+        resumed, _ = IntcodeComputer.resume(path)
+        self.assertEqual(list(resumed.stream(group=2)), [(3,)])
+        self.assertTrue(resumed.is_done())
+        with open(path, "wb") as checkpoint_file:
+            checkpoint_file.write(zlib.compress(b'{"version":0}'))
+        self.assertRaises(ValueError, IntcodeComputer.resume, path)
+
     def test_intcode_large(self):
         ints = [3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,
                 1106,0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,
@@ -185,3 +938,163 @@ class TestIntcodeComputer(unittest.TestCase):
         large_num = [104,1125899906842624,99]
         self.assertEqual(IntcodeComputer(large_num).run(), large_num[1])
 
+class TestFusion(unittest.TestCase):
+    def test_fusion_sites(self):
+        # Counts cell 12 down to 0: an ADD tested by the next jump.
+        countdown = [1001,12,-1,12,1005,12,0,4,12,99,0,0,5]
+        c = IntcodeComputer(countdown)
+        self.assertEqual(c._match_fusion(0), 7)
+        self.assertEqual(c._match_fusion(4), None)
+        self.assertEqual(c.run(), 0)
+        self.assertEqual(c._decoded[0][3], 7)
+        # A compare tested by the next jump, with relative operands.
+        ints = [109,20,21107,0,1,0,1205,0,11,104,5,104,6,99]
+        c = IntcodeComputer(ints)
+        self.assertEqual(c._match_fusion(2), 7)
+        self.assertEqual(c.run(), 6)
+        # ADD of 0 and MULTIPLY by 1 run as moves, leaving memory untouched.
+        moves = [1001,11,0,12,102,1,12,13,4,13,99,42,0,0]
+        c = IntcodeComputer(moves)
+        self.assertEqual(c.run(), 42)
+        self.assertEqual(c._decoded[0][0], c._move)
+        self.assertEqual(c._decoded[4][0], c._move)
+        self.assertEqual([c.memory.read(i) for i in range(11)], moves[:11])
+
+    def test_fusion_reverted_on_write(self):
+        # Counts down twice; in between, the jump target is rewritten to 20.
+        ints = [1001,30,-1,30,1005,30,0,4,30,1101,0,20,6,1101,0,3,30,
+                1105,1,0,104,99,99] + [0] * 7 + [2]
+        c = IntcodeComputer(ints)
+        self.assertEqual(c.run(), [0, 99])
+        # Fused again with the new target once the write dropped it.
+        self.assertEqual(c._decoded[0][3], 7)
+        # Fused code run in a profiled or budgeted loop counts each part.
+        loop = [3,30,1001,30,-1,30,1005,30,2,4,30,1105,1,0] + [0] * 17
+        c = IntcodeComputer(loop, wait_for_input=True)
+        self.assertEqual(c.run([2]), 0)
+        self.assertEqual(c._decoded[2][3], 7)
+        c.stats = Profile()
+        self.assertEqual(c.run([3]), 0)
+        self.assertEqual(c.stats.instructions, 9)
+        self.assertEqual(c.run([1], budget=3), [])
+        self.assertEqual(c.run(), 0)
+
+class TestMemory(unittest.TestCase):
+    def test_memory_read_write(self):
+        memory = Memory([1, 2, 3])
+        self.assertEqual(memory.read(2), 3)
+        self.assertEqual(memory.read(100 * PAGE_SIZE), 0)
+        self.assertEqual(len(memory), PAGE_SIZE) # Reads don't allocate.
+        memory.write(PAGE_SIZE + 10, 7)
+        self.assertEqual(memory.read(PAGE_SIZE + 10), 7)
+        self.assertEqual(memory.read(PAGE_SIZE + 9), 0)
+        self.assertEqual(len(memory), 2 * PAGE_SIZE)
+        memory.write(1, 2**70) # Values aren't limited to 64 bits.
+        self.assertEqual(memory.read(1), 2**70)
+
+    def test_memory_sparse(self):
+        memory = Memory([1, 2, 3])
+        far = 2 * Memory.MAX_GAP
+        memory.write(far, 5)
+        self.assertEqual(memory.read(far), 5)
+        self.assertEqual(len(memory), PAGE_SIZE + 1)
+        self.assertEqual(memory.sparse, {far: 5})
+        # Growing the dense region absorbs the sparse cells it reaches.
+        memory.write(Memory.MAX_GAP, 1)
+        memory.write(far + 1, 6)
+        self.assertEqual(memory.sparse, {})
+        self.assertEqual([memory.read(a) for a in range(far - 1, far + 3)],
+                         [0, 5, 6, 0])
+        self.assertEqual(memory.read(Memory.MAX_GAP), 1)
+
+    def test_memory_negative_address(self):
+        memory = Memory([1, 2, 3])
+        self.assertRaises(ValueError, memory.read, -1)
+        self.assertRaises(ValueError, memory.write, -1, 0)
+        self.assertRaises(ValueError, IntcodeComputer([4,-1,99]).run)
+        self.assertRaises(ValueError, IntcodeComputer([204,-1,99]).run)
+
+    def test_memory_footprint(self):
+        small = IntcodeComputer([1101,1,1,1000,99])
+        large = IntcodeComputer([1101,1,1,100000,99])
+        small.run()
+        large.run()
+        self.assertLess(small.memory.footprint(), 100000)
+        self.assertLess(large.memory.footprint(), 100000)
+        self.assertEqual(len(large.memory), PAGE_SIZE + 1)
+
+    def test_memory_fork(self):
+        memory = Memory(range(4 * PAGE_SIZE))
+        memory.write(5 * Memory.MAX_GAP, 9)
+        fork = memory.fork()
+        fork.write(1, -1)
+        fork.write(5 * Memory.MAX_GAP, -9)
+        memory.write(2 * PAGE_SIZE, -2)
+        self.assertEqual([memory.read(1), fork.read(1)], [1, -1])
+        self.assertEqual([memory.read(2 * PAGE_SIZE), fork.read(2 * PAGE_SIZE)],
+                         [-2, 2 * PAGE_SIZE])
+        self.assertEqual([memory.read(5 * Memory.MAX_GAP),
+                          fork.read(5 * Memory.MAX_GAP)], [9, -9])
+        # Each side only pays for the page it wrote.
+        self.assertEqual(len(memory._owned), 1)
+        self.assertEqual(len(fork._owned), 1)
+        self.assertLess(fork.footprint(), Memory(range(PAGE_SIZE)).footprint()
+                        + Memory(range(4 * PAGE_SIZE)).footprint())
+
+class TestProfile(unittest.TestCase):
+    def test_profile(self):
+        # Counts memory[13] down from 3, outputting each value.
+        countdown = [4,13,1001,13,-1,13,1005,13,0,104,0,99,0,3]
+        c = IntcodeComputer(countdown, profile=True)
+        self.assertEqual(c.run(), [3, 2, 1, 0])
+        stats = c.stats
+        self.assertEqual(stats.instructions, 3 * 3 + 2)
+        self.assertEqual(stats.opcodes, {"OUTPUT": 4, "ADD": 3,
+                                         "JUMP_IF_TRUE": 3, "HALT": 1})
+        self.assertEqual(stats.ips, {0: 3, 2: 3, 6: 3, 9: 1, 11: 1})
+        self.assertEqual(stats.jumps, {(6, 0): 2})
+        self.assertEqual(stats.outputs, 4)
+        self.assertEqual(stats.hot_loops(), [(0, 6, 9)])
+        self.assertIn("0-6", stats.report())
+        self.assertIsNone(IntcodeComputer(countdown).stats)
+
+    def test_profile_input_wait(self):
+        c = IntcodeComputer([3,0,99], wait_for_input=True, profile=True)
+        c.run()
+        self.assertEqual(c.stats.instructions, 0) # Input never arrived.
+        c.run([5])
+        self.assertEqual(c.stats.opcodes, {"INPUT": 1, "HALT": 1})
+        self.assertGreater(c.stats.input_wait, 0)
+
+class TestRunMany(unittest.TestCase):
+    # Outputs 1000 if the input is above 8, 999 below and 1000 at 8.
+    compare8 = [3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,
+                1106,0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,
+                999,1105,1,46,1101,1000,1,20,4,20,1105,1,46,98,99]
+
+    def test_run_many(self):
+        input_sets = [[x] for x in range(5, 12)]
+        expected = [IntcodeComputer(self.compare8).run(inputs)
+                    for inputs in input_sets]
+        for workers in [1, 2]:
+            results = run_many(self.compare8, input_sets, workers=workers,
+                               chunksize=2)
+            self.assertEqual([r.index for r in results], list(range(7)))
+            self.assertEqual([r.outputs for r in results], expected)
+
+    def test_run_many_patches(self):
+        # Multiplies memory[1] by memory[2] into memory[0].
+        nouns_verbs = [(x, y) for x in range(10) for y in range(10)]
+        patches = [{1: x, 2: y} for x, y in nouns_verbs]
+        result = run_many([1102,0,0,0,99], [[]] * len(patches), patches,
+                          read=[0], workers=2, chunksize=7,
+                          until=lambda result: result.cells == (42,))
+        self.assertIn(nouns_verbs[result.index], [(6, 7), (7, 6)])
+        self.assertIsNone(run_many([1102,0,0,0,99], [[]], read=[0], workers=1,
+                                   until=lambda result: result.cells[0]))
+
+    def test_run_many_reducer(self):
+        max_output = lambda a, b: max(a, b, key=lambda r: (r.outputs, -r.index))
+        result = run_many(self.compare8, [[x] for x in range(12)], workers=2,
+                          chunksize=3, reducer=max_output)
+        self.assertEqual(result, RunResult(9, 1001, ()))
@@ -0,0 +1,185 @@
+from array import array
+from collections import defaultdict
+from collections import deque
+import unittest
+
+from intcode import IntcodeComputer
+from intcode import Memory
+
+Mode = IntcodeComputer.Mode
+
+class IntcodeBatch:
+    """Runs many instances of one Intcode program in lockstep.
+
+    Each instance's memory is a row of int64 cells. Every step, the running
+    instances are grouped by ip and instruction, so each group decodes once
+    and executes its opcode as one pass over the group. An instance that
+    writes a value (or a far address) that doesn't fit its row drops out and
+    finishes on the scalar IntcodeComputer.
+    """
+    def __init__(self, ints, count):
+        self.ips = [0] * count
+        self.bases = [0] * count
+        self.inputs = [deque() for _ in range(count)]
+        self.outputs = [[] for _ in range(count)]
+        self.scalar = {} # {instance: IntcodeComputer} for dropped instances.
+        try:
+            image = array("q", ints)
+            self.rows = [array("q", image) for _ in range(count)]
+        except OverflowError:
+            self.rows = [None] * count
+            for i in range(count):
+                self.scalar[i] = IntcodeComputer(ints)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def read(self, i, address):
+        if i in self.scalar:
+            return self.scalar[i].memory.read(address)
+        if address < 0:
+            raise ValueError("Invalid negative address {}.".format(address))
+        row = self.rows[i]
+        return row[address] if address < len(row) else 0
+
+    def write(self, i, address, value):
+        """Sets a memory cell, e.g. to patch a program before running it."""
+        if i in self.scalar:
+            self.scalar[i].memory.write(address, value)
+            return
+        try:
+            self._write(i, address, value)
+        except OverflowError:
+            self._drop(i)
+            self.scalar[i].memory.write(address, value)
+
+    def run(self, input_sets=None):
+        """Runs every instance to completion with its own inputs.
+
+        Returns each instance's outputs in the same shape as
+        IntcodeComputer.run: a single value, or a list otherwise.
+        """
+        if input_sets is not None:
+            for inputs, values in zip(self.inputs, input_sets):
+                inputs.extend(values)
+        active = [i for i in range(len(self)) if i not in self.scalar]
+        while active:
+            groups = defaultdict(list)
+            for i in active:
+                groups[(self.ips[i], self.read(i, self.ips[i]))].append(i)
+            active = []
+            for (ip, instruction), group in groups.items():
+                opcode, modes = IntcodeComputer._parse_instruction(instruction)
+                active.extend(self._execute(ip, opcode, modes, group))
+        for i, computer in self.scalar.items():
+            if not computer.is_done():
+                self.outputs[i].extend(computer.stream(self.inputs[i]))
+        return [outputs[0] if len(outputs) == 1 else outputs
+                for outputs in self.outputs]
+
+    def _execute(self, ip, opcode, modes, group):
+        # Returns the instances from the group that are still running.
+        if opcode == 99:
+            return []
+        read = self.read
+        pos = [[self._address(i, ip, j, mode) for j, mode in enumerate(modes)]
+               for i in group]
+        running = []
+        for i, p in zip(group, pos):
+            try:
+                if opcode == 1:
+                    self._write(i, p[2], read(i, p[0]) + read(i, p[1]))
+                elif opcode == 2:
+                    self._write(i, p[2], read(i, p[0]) * read(i, p[1]))
+                elif opcode == 3:
+                    if not self.inputs[i]:
+                        raise ValueError("Input instruction missing input.")
+                    self._write(i, p[0], self.inputs[i][0])
+                    self.inputs[i].popleft()
+                elif opcode == 4:
+                    self.outputs[i].append(read(i, p[0]))
+                elif opcode == 5 or opcode == 6:
+                    if (read(i, p[0]) != 0) == (opcode == 5):
+                        self.ips[i] = read(i, p[1])
+                        running.append(i)
+                        continue
+                elif opcode == 7:
+                    self._write(i, p[2], int(read(i, p[0]) < read(i, p[1])))
+                elif opcode == 8:
+                    self._write(i, p[2], int(read(i, p[0]) == read(i, p[1])))
+                elif opcode == 9:
+                    self.bases[i] += read(i, p[0])
+            except OverflowError:
+                self._drop(i) # Rerun this instruction on the scalar engine.
+                continue
+            self.ips[i] = ip + len(modes) + 1
+            running.append(i)
+        return running
+
+    def _address(self, i, ip, j, mode):
+        if mode == Mode.IMMEDIATE:
+            return ip + 1 + j
+        elif mode == Mode.RELATIVE:
+            return self.bases[i] + self.read(i, ip + 1 + j)
+        return self.read(i, ip + 1 + j)
+
+    def _write(self, i, address, value):
+        if address < 0:
+            raise ValueError("Invalid negative address {}.".format(address))
+        row = self.rows[i]
+        if address >= len(row):
+            if address - len(row) > Memory.MAX_GAP:
+                raise OverflowError("Address {} is too far past the end."
+                                    .format(address))
+            row.extend(array("q", bytes(8 * (address + 1 - len(row)))))
+        row[address] = value
+
+    def _drop(self, i):
+        computer = IntcodeComputer(self.rows[i])
+        computer.ip = self.ips[i]
+        computer.base = self.bases[i]
+        self.scalar[i] = computer
+        self.rows[i] = None
+
+def run_batch(ints, input_sets):
+    """Runs the program once per input set and returns each run's outputs."""
+    input_sets = list(input_sets)
+    return IntcodeBatch(ints, len(input_sets)).run(input_sets)
+
+class TestIntcodeBatch(unittest.TestCase):
+    def test_run_batch(self):
+        ints = [3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,
+                1106,0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,
+                999,1105,1,46,1101,1000,1,20,4,20,1105,1,46,98,99]
+        self.assertEqual(run_batch(ints, [[7], [8], [9], [-5]]),
+                         [999, 1000, 1001, 999])
+        quine = [109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99]
+        self.assertEqual(run_batch(quine, [[], []]), [quine, quine])
+        self.assertEqual(run_batch([99], [[]]), [[]])
+
+    def test_run_batch_write(self):
+        # Outputs memory[0] after computing memory[1] * memory[2] into it.
+        ints = [1102,0,0,0,4,0,99]
+        batch = IntcodeBatch(ints, 3)
+        for i, (a, b) in enumerate([(3, 4), (5, 6), (2**40, 2**40)]):
+            batch.write(i, 1, a)
+            batch.write(i, 2, b)
+        self.assertEqual(batch.run(), [12, 30, 2**80])
+        self.assertEqual([batch.read(i, 0) for i in range(3)],
+                         [12, 30, 2**80])
+        self.assertEqual(list(batch.scalar), [2])
+
+    def test_run_batch_overflow(self):
+        # The overflowing instance falls back, the others stay in the batch.
+        square = [3,9,2,9,9,9,4,9,99,0]
+        self.assertEqual(run_batch(square, [[3], [2**40], [-4]]),
+                         [9, 2**80, 16])
+        large_num = [104,2**70,99]
+        self.assertEqual(run_batch(large_num, [[], []]), [2**70, 2**70])
+        far = [1101,1,1,10**9,4,10**9,99]
+        self.assertEqual(run_batch(far, [[]]), [2])
+
+    def test_run_batch_invalid(self):
+        self.assertRaises(ValueError, run_batch, [1055,0,99], [[]])
+        self.assertRaises(ValueError, run_batch, [3,0,99], [[1], []])
+        self.assertRaises(ValueError, run_batch, [4,-1,99], [[]])
@@ -0,0 +1,246 @@
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from tempfile import TemporaryDirectory
+import os
+import sqlite3
+import struct
+import sys
+import time
+import unittest
+
+from intcode import IntcodeComputer
+
+CachedResult = namedtuple("CachedResult",
+                          ("outputs", "memory_digest", "instructions"))
+LENGTH = struct.Struct("<QQ") # Values and bytes in each part of a key.
+
+def program_key(ints, inputs=()):
+    """Content hash of a program image and its input sequence. Each part is
+    tagged with its type and length, so no two (ints, inputs) pairs hash
+    the same bytes."""
+    digest = sha256()
+    for values in (ints, inputs):
+        try:
+            data = array("q", values).tobytes()
+            tag = b"q"
+        except OverflowError:
+            data = ",".join(map(str, values)).encode()
+            tag = b"s"
+        digest.update(tag + LENGTH.pack(len(values), len(data)) + data)
+    return digest.hexdigest()
+
+def memory_digest(memory):
+    """Hash of every nonzero cell, independent of how memory is laid out."""
+    digest = sha256()
+    cells = [(address, value) for address, value in enumerate(
+             value for page in memory.pages for value in page) if value]
+    cells.extend(sorted((a, v) for a, v in memory.sparse.items() if v))
+    for address, value in cells:
+        digest.update("{}:{},".format(address, value).encode())
+    return digest.hexdigest()
+
+class ResultCache:
+    """On-disk cache of the results of deterministic Intcode runs.
+
+    Results are keyed by program_key(ints, inputs) in an SQLite database, so
+    several processes can share one cache file. Once the stored results
+    exceed max_bytes, the least recently used ones are evicted.
+    """
+    TOUCH_INTERVAL = 1.0 # Seconds before a hit updates the entry's LRU time.
+
+    def __init__(self, path, max_bytes=64 << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = self.TOUCH_INTERVAL
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(path, timeout=30,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, "
+            "outputs TEXT NOT NULL, memory_digest TEXT NOT NULL, "
+            "instructions INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "last_used REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_lru "
+                                 "ON results (last_used)")
+
+    def __len__(self):
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    def run(self, ints, inputs=()):
+        """Returns the CachedResult of running the program with inputs,
+        running it on a miss. The run has a budget it never reaches, which
+        counts instructions far more cheaply than profiling."""
+        inputs = list(inputs)
+        key = program_key(ints, inputs)
+        result = self.get(key)
+        if result is not None:
+            return result
+        computer = IntcodeComputer(ints)
+        outputs = list(computer.stream(inputs, budget=sys.maxsize))
+        result = CachedResult(outputs, memory_digest(computer.memory),
+                              computer.steps)
+        self.put(key, result)
+        return result
+
+    def get(self, key):
+        row = self._connection.execute(
+            "SELECT outputs, memory_digest, instructions, last_used "
+            "FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        outputs, digest, instructions, last_used = row
+        now = time.time()
+        if now - last_used >= self.touch_interval:
+            self._connection.execute("UPDATE results SET last_used = ? "
+                                     "WHERE key = ?", (now, key))
+        return CachedResult([int(x) for x in outputs.split(",") if x],
+                            digest, instructions)
+
+    def put(self, key, result):
+        outputs = ",".join(map(str, result.outputs))
+        size = len(key) + len(outputs) + len(result.memory_digest)
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, outputs, result.memory_digest, result.instructions,
+                 size, time.time()))
+            self._evict()
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _evict(self):
+        total = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._connection.execute(
+                "SELECT key, size FROM results ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._connection.executemany("DELETE FROM results WHERE key = ?",
+                                     evicted)
+
+def cached_run(ints, inputs=(), cache=None):
+    """Runs the program through cache, or through the cache file named by
+    the INTCODE_CACHE environment variable. Returns a CachedResult. Without
+    either, the program just runs, and only its outputs are filled in."""
+    if cache is None:
+        path = os.environ.get("INTCODE_CACHE")
+        if not path:
+            outputs = list(IntcodeComputer(ints).stream(inputs))
+            return CachedResult(outputs, None, None)
+        cache = ResultCache(path)
+        try:
+            return cache.run(ints, inputs)
+        finally:
+            cache.close()
+    return cache.run(ints, inputs)
+
+def _run_in_process(path, ints, inputs):
+    cache = ResultCache(path)
+    try:
+        return cache.run(ints, inputs)
+    finally:
+        cache.close()
+
+class TestResultCache(unittest.TestCase):
+    quine = [109,1,204,-1,1001,100,1,100,1008,100,16,101,1006,101,0,99]
+
+    def setUp(self):
+        self.path = os.path.join(
+            self.enterContext(TemporaryDirectory()), "cache.sqlite")
+
+    def test_cache_hit(self):
+        cache = ResultCache(self.path)
+        self.addCleanup(cache.close)
+        result = cache.run(self.quine)
+        self.assertEqual(result.outputs, self.quine)
+        profiled = IntcodeComputer(self.quine, profile=True)
+        profiled.run()
+        self.assertEqual(result.instructions, profiled.stats.instructions)
+        self.assertEqual(cache.run(self.quine), result)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # Different inputs or programs are different keys.
+        echo = [3,0,4,0,99]
+        self.assertEqual(cache.run(echo, [5]).outputs, [5])
+        self.assertEqual(cache.run(echo, [6]).outputs, [6])
+        self.assertEqual(cache.run([104,2**70,99]).outputs, [2**70])
+        self.assertEqual(cache.run([99]).outputs, [])
+        self.assertEqual(len(cache), 5)
+        # Results persist across instances.
+        other = ResultCache(self.path)
+        self.addCleanup(other.close)
+        self.assertEqual(other.run(echo, [5]).outputs, [5])
+        self.assertEqual(other.hits, 1)
+
+    def test_memory_digest(self):
+        a = IntcodeComputer([1101,1,1,5000,99])
+        b = IntcodeComputer([1101,1,1,5000,99,0,0])
+        a.run()
+        b.run()
+        self.assertEqual(memory_digest(a.memory), memory_digest(b.memory))
+        cache = ResultCache(self.path)
+        self.addCleanup(cache.close)
+        self.assertEqual(cached_run([1101,1,1,5000,99], cache=cache)
+                         .memory_digest, memory_digest(a.memory))
+        self.assertEqual(cached_run([1101,1,1,5000,99]),
+                         CachedResult([], None, None))
+        self.assertNotEqual(memory_digest(a.memory),
+                            memory_digest(IntcodeComputer([99]).memory))
+
+    def test_lru_eviction(self):
+        cache = ResultCache(self.path, max_bytes=500)
+        cache.touch_interval = 0
+        self.addCleanup(cache.close)
+        programs = [[104,i,99] for i in range(5)]
+        for ints in programs[:3]:
+            cache.run(ints)
+        cache.run(programs[0]) # Now programs[1] is least recently used.
+        for ints in programs[3:]:
+            cache.run(ints)
+        self.assertLess(len(cache), 5)
+        hits = cache.hits
+        cache.run(programs[0])
+        cache.run(programs[4])
+        self.assertEqual(cache.hits, hits + 2)
+        misses = cache.misses
+        cache.run(programs[1])
+        self.assertEqual(cache.misses, misses + 1)
+
+    def test_shared_across_processes(self):
+        with ProcessPoolExecutor(2) as executor:
+            results = list(executor.map(_run_in_process, [self.path] * 8,
+                                        [self.quine] * 4 + [[104,1,99]] * 4,
+                                        [[]] * 8))
+        self.assertEqual([r.outputs for r in results],
+                         [self.quine] * 4 + [[1]] * 4)
+        cache = ResultCache(self.path)
+        self.addCleanup(cache.close)
+        self.assertEqual(len(cache), 2)
+
+    def test_program_key(self):
+        # Without lengths, these hashed the same bytes.
+        z = struct.unpack("<q", b"\0" * 7 + b"q")[0]
+        x = struct.unpack("<q", b"q" + struct.pack("<q", z)[:7])[0]
+        self.assertNotEqual(program_key([1, x], [5]), program_key([1], [z, 5]))
+        self.assertNotEqual(program_key([2**70], [1]),
+                            program_key([2**70, 1], []))
+        self.assertEqual(program_key([1, 2], [3]), program_key([1, 2], [3]))
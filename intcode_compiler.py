@@ -0,0 +1,257 @@
+from unittest.mock import patch
+
+import intcode
+from intcode import IntcodeComputer
+from intcode import PAGE_BITS
+from intcode import PAGE_MASK
+from intcode import PAGE_SIZE
+
+Mode = IntcodeComputer.Mode
+
+class CompiledIntcodeComputer(IntcodeComputer):
+    """IntcodeComputer that compiles basic blocks into Python functions.
+
+    A block starts at a jump target (or wherever execution falls through to)
+    and runs past conditional jumps up to an unconditional jump or output.
+    Operand modes are resolved when the block is compiled, and memory pages
+    are read and written directly through locals. A write to a cell holding
+    compiled code drops the blocks covering it, and those cells are
+    interpreted from then on. Tracing and profiling use the interpreter.
+    """
+    MAX_BLOCK = 64 # Instructions per block, bounding code duplicated by
+                   # jumps into the middle of an existing block.
+
+    # Block return values other than None, which just continues at ip.
+    _WAIT = 3 # Stopped at an INPUT instruction with no input ready.
+    _RELOAD = 4 # Wrote through the slow path, so memory may have moved.
+
+    def _set_memory(self, memory):
+        super()._set_memory(memory)
+        self._blocks = {} # {ip: compiled block}
+        self._block_ends = {} # {ip: address just past the block}
+        self._block_cells = {} # {address: {ip of each block covering it}}
+        self._watched = set() # Addresses holding compiled or decoded code.
+        self._interpreted = set() # Addresses of dropped blocks.
+
+    def _loop(self, group):
+        outputs = self._outputs
+        FLUSH = self._FLUSH
+        WAIT = self._WAIT
+        read = self._read
+        write = self._write_from_block
+        read_input = self._read_input
+        watched = self._watched
+        get_block = self._blocks.get
+        ip = self.ip
+        base = self.base
+        while True:
+            memory = self.memory
+            pages = memory.pages
+            owned = memory._owned
+            end = len(pages) * PAGE_SIZE
+            signal = None
+            while True:
+                block = get_block(ip)
+                if block is None:
+                    break
+                ip, base, signal = block(base, pages, owned, watched, end,
+                                         read, write, outputs, read_input)
+                if signal:
+                    break
+            self.ip = ip
+            self.base = base
+            if block is None:
+                if self._compile(ip) is not None:
+                    continue
+                signal = self._step()
+            elif signal == WAIT:
+                signal = self._step() # Wait or raise like the interpreter.
+            ip = self.ip
+            base = self.base
+            if signal:
+                if signal is FLUSH:
+                    if len(outputs) == group:
+                        value = outputs[0] if group == 1 else tuple(outputs)
+                        outputs.clear()
+                        yield value
+                elif signal is not self._RELOAD:
+                    break
+        if self.done and outputs:
+            value = tuple(outputs) # Program halted part way through a group.
+            outputs.clear()
+            yield value
+
+    def _step(self):
+        # Runs the instruction at ip in the interpreter.
+        handler, pos, relative, _ = (self._decoded.get(self.ip) or
+                                     self._decode(self.ip))
+        if relative:
+            base = self.base
+            pos = [p + base if r else p for p, r in zip(pos, relative)]
+        return handler(pos)
+
+    def _decode(self, ip):
+        instruction = super()._decode(ip)
+        self._watched.update(range(ip, ip + instruction[3]))
+        return instruction
+
+    def _write(self, address, value):
+        super()._write(address, value)
+        if address in self._block_cells:
+            self._drop_blocks(address)
+
+    def _write_from_block(self, address, value):
+        # Returns True if the block must stop: the write hit code or changed
+        # the pages the block is using.
+        pages = self.memory.pages
+        size = len(pages)
+        self._write(address, value)
+        return (address in self._watched or self.memory.pages is not pages
+                or len(pages) != size)
+
+    def _drop_blocks(self, address):
+        for ip in self._block_cells.pop(address):
+            del self._blocks[ip]
+            end = self._block_ends.pop(ip)
+            for other in range(ip, end):
+                self._interpreted.add(other)
+                if other != address:
+                    self._block_cells[other].discard(ip)
+
+    def _compile(self, ip):
+        # Returns None if the instruction at ip should be interpreted.
+        lines = []
+        address = ip
+        ended = False
+        for _ in range(self.MAX_BLOCK):
+            if ended:
+                break
+            try:
+                opcode, modes = self._parse_instruction(self._read(address))
+            except ValueError:
+                break # Raised by the interpreter if it is ever reached.
+            end = address + len(modes) + 1
+            if opcode == 99 or not self._interpreted.isdisjoint(
+                    range(address, end)):
+                break
+            code, ended = self._compile_instruction(address, opcode, modes)
+            lines.extend(code)
+            address = end
+        if address == ip:
+            return None
+        if not ended:
+            lines.append("return {}, base, None".format(address))
+        source = ("def block(base, P, O, W, E, rd, wr, out, inp):\n{}\n"
+                  .format("\n".join("    " + line for line in lines)))
+        namespace = {}
+        exec(compile(source, "<intcode block {}>".format(ip), "exec"),
+             namespace)
+        block = namespace["block"]
+        self._blocks[ip] = block
+        self._block_ends[ip] = address
+        for other in range(ip, address):
+            self._block_cells.setdefault(other, set()).add(ip)
+        self._watched.update(range(ip, address))
+        return block
+
+    def _compile_instruction(self, ip, opcode, modes):
+        # Returns the block's lines for the instruction, and whether it ends
+        # the block.
+        params = [self._read(ip + 1 + j) for j in range(len(modes))]
+        args = [self._operand(param, mode, "a{}".format(j))
+                for j, (param, mode) in enumerate(zip(params, modes))]
+        next_ip = ip + len(modes) + 1
+        if opcode in (1, 2, 7, 8) and modes[0] == modes[1] == Mode.IMMEDIATE:
+            a, b = params[:2]
+            value = {1: a + b, 2: a * b, 7: int(a < b), 8: int(a == b)}[opcode]
+            return self._store(params[2], modes[2], next_ip, repr(value)), False
+        elif opcode == 1:
+            return self._store(params[2], modes[2], next_ip,
+                               "{} + {}".format(args[0], args[1])), False
+        elif opcode == 2:
+            return self._store(params[2], modes[2], next_ip,
+                               "{} * {}".format(args[0], args[1])), False
+        elif opcode == 3:
+            return (["v = inp()",
+                     "if v is None: return {}, base, {}".format(ip, self._WAIT)]
+                    + self._store(params[0], modes[0], next_ip)), False
+        elif opcode == 4:
+            return ["out.append({})".format(args[0]),
+                    "return {}, base, {}".format(next_ip, self._FLUSH)], True
+        elif opcode == 5 or opcode == 6:
+            if modes[0] == Mode.IMMEDIATE:
+                if (params[0] != 0) != (opcode == 5):
+                    return [], False # Never jumps.
+                return ["return {}, base, None".format(args[1])], True
+            return ["if {} {} 0: return {}, base, None".format(
+                        args[0], "!=" if opcode == 5 else "==", args[1])], False
+        elif opcode == 7 or opcode == 8:
+            return self._store(params[2], modes[2], next_ip,
+                               "1 if {} {} {} else 0".format(
+                                   args[0], "<" if opcode == 7 else "==",
+                                   args[1])), False
+        elif opcode == 9:
+            return ["base += {}".format(args[0])], False
+
+    def _operand(self, param, mode, name):
+        if mode == Mode.IMMEDIATE:
+            return repr(param)
+        elif mode == Mode.RELATIVE:
+            return ("(P[{0} >> {1}][{0} & {2}] if 0 <= ({0} := base + {3}) < E "
+                    "else rd({0}))".format(name, PAGE_BITS, PAGE_MASK, param))
+        elif 0 <= param < len(self.memory.pages) * PAGE_SIZE:
+            return "P[{}][{}]".format(param >> PAGE_BITS, param & PAGE_MASK)
+        return "rd({})".format(param)
+
+    def _store(self, param, mode, next_ip, value=None):
+        lines = [] if value is None else ["v = " + value]
+        exit = "return {}, base, {}".format(next_ip, self._RELOAD)
+        if mode == Mode.RELATIVE:
+            lines.append("a = base + {}".format(param))
+            lines.append("if 0 <= a < E and a >> {0} in O and a not in W: "
+                         "P[a >> {0}][a & {1}] = v".format(PAGE_BITS, PAGE_MASK))
+            lines.append("elif wr(a, v): " + exit)
+        elif 0 <= param < len(self.memory.pages) * PAGE_SIZE:
+            page = param >> PAGE_BITS
+            lines.append("if {} in O and {} not in W: P[{}][{}] = v".format(
+                         page, param, page, param & PAGE_MASK))
+            lines.append("elif wr({}, v): {}".format(param, exit))
+        else:
+            lines.append("if wr({}, v): {}".format(param, exit))
+        return lines
+
+class TestCompiledIntcodeComputer(intcode.TestIntcodeComputer):
+    # Reruns the whole interpreter suite against the compiled computer.
+    def setUp(self):
+        self.enterContext(patch("intcode.IntcodeComputer",
+                                CompiledIntcodeComputer))
+
+    def test_compiled_blocks(self):
+        ints = [3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,
+                1106,0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,
+                999,1105,1,46,1101,1000,1,20,4,20,1105,1,46,98,99]
+        c = CompiledIntcodeComputer(ints)
+        self.assertEqual(c.run([9]), 1001)
+        self.assertEqual(sorted(c._blocks), [0, 36, 42])
+        self.assertEqual(c._interpreted, set())
+
+    def test_compiled_self_modifying(self):
+        # Address 1 holds an operand of the compiled block at 0.
+        ints = [104,7,1101,0,9,1,1005,17,16,1101,1,0,17,1105,1,0,99,0]
+        c = CompiledIntcodeComputer(ints)
+        self.assertEqual(c.run(), [7, 9])
+        self.assertNotIn(0, c._blocks)
+        self.assertEqual(c._interpreted, {0, 1})
+        # A loop that decrements its output's immediate operand.
+        countdown = [104,3,1001,1,-1,1,1005,1,0,99]
+        self.assertEqual(CompiledIntcodeComputer(countdown).run(), [3, 2, 1])
+
+    def test_compiled_fork(self):
+        accumulate = [3,11,1,11,12,12,4,12,1105,1,0,0,0]
+        c = CompiledIntcodeComputer(accumulate, wait_for_input=True)
+        self.assertEqual(c.run([5]), 5)
+        fork = c.fork()
+        self.assertIsInstance(fork, CompiledIntcodeComputer)
+        self.assertEqual(c.run([1]), 6)
+        self.assertEqual(fork.run([2]), 7)
+        self.assertEqual(c.run([1]), 7)
@@ -0,0 +1,331 @@
+from collections import namedtuple
+from itertools import repeat
+from random import Random
+from time import perf_counter
+import json
+import unittest
+
+from intcode import IntcodeComputer
+from intcode_compiler import CompiledIntcodeComputer
+import day02
+import day05
+
+Engine = namedtuple("Engine", ("name", "opcodes", "modes", "run"))
+# Opcodes (besides HALT) and parameter modes a generated program may use.
+Subset = namedtuple("Subset", ("name", "opcodes", "modes"))
+Result = namedtuple("Result", ("outputs", "memory", "error"))
+
+SUBSETS = [
+    Subset("day02", (1, 2), (0,)),
+    Subset("day05", (1, 2, 3, 4, 5, 6, 7, 8), (0, 1)),
+    Subset("intcode", (1, 2, 3, 4, 5, 6, 7, 8, 9), (0, 1, 2)),
+]
+
+def _run_day02(ints, value):
+    memory = list(ints)
+    try:
+        day02.run_intcode_program(memory)
+    except Exception as error:
+        return Result(None, memory, type(error).__name__)
+    return Result([], memory, None)
+
+def _run_day05(ints, value):
+    memory = list(ints)
+    try:
+        outputs = day05.run_intcode(memory, value)
+    except Exception as error:
+        return Result(None, memory, type(error).__name__)
+    return Result(outputs, memory, None)
+
+def computer_engine(computer_class):
+    """Returns an Engine run function for an IntcodeComputer class."""
+    def run(ints, value):
+        computer = computer_class(ints)
+        try:
+            outputs = list(computer.stream(repeat(value)))
+            error = None
+        except Exception as e:
+            outputs = None
+            error = type(e).__name__
+        memory = [computer.memory.read(i) for i in range(len(ints))]
+        return Result(outputs, memory, error)
+    return run
+
+ENGINES = [
+    Engine("day02.run_intcode_program", (1, 2), (0,), _run_day02),
+    Engine("day05.run_intcode", (1, 2, 3, 4, 5, 6, 7, 8), (0, 1), _run_day05),
+    Engine("IntcodeComputer", (1, 2, 3, 4, 5, 6, 7, 8, 9), (0, 1, 2),
+           computer_engine(IntcodeComputer)),
+    Engine("CompiledIntcodeComputer", (1, 2, 3, 4, 5, 6, 7, 8, 9), (0, 1, 2),
+           computer_engine(CompiledIntcodeComputer)),
+]
+
+def register_engine(name, opcodes, modes, run):
+    """Adds an engine to check. run(ints, value) returns a Result, where
+    value is the input read by every INPUT instruction."""
+    ENGINES.append(Engine(name, tuple(opcodes), tuple(modes), run))
+
+def random_program(rng, subset, size=12, data=12, invalid=0.05,
+                   self_modify=0.0):
+    """Returns a random program using only the subset's opcodes and modes.
+
+    Code comes first, then data cells. Writes only go to data cells and
+    jumps only go forward, so the program halts. With jumps available, the
+    body repeats a few times under a counter in the last data cell. With
+    relative mode, base starts at the data and each relative instruction is
+    wrapped in a matching pair of ADJUST_BASE. Each instruction is replaced
+    by one that is invalid for every engine with probability invalid.
+
+    With probability self_modify, an instruction is preceded by a patch: an
+    ADD copying a constant (kept after the data) over the opcode or an
+    operand of a later instruction. Patches only swap in another opcode
+    with the same modes, or another operand of the same kind, and never
+    touch jumps or other patches, so the program still halts.
+    """
+    Mode = IntcodeComputer.Mode
+    jumps = 5 in subset.opcodes and Mode.IMMEDIATE in subset.modes
+    relative = Mode.RELATIVE in subset.modes
+    choices = [op for op in subset.opcodes if op != 9]
+    # Opcodes a patch may swap for each other.
+    swaps = [op for op in (1, 2, 7, 8) if op in subset.opcodes]
+    units = [] # Each is [(opcode, modes, base shift)], jumps go between.
+    for _ in range(size):
+        if rng.random() < invalid:
+            units.append([(None, (), 0)])
+            continue
+        if rng.random() < self_modify:
+            units.append([("patch", (), 0)]) # Target picked below.
+        opcode = rng.choice(choices)
+        params = IntcodeComputer._OPCODES[opcode]
+        modes = [rng.choice(subset.modes) for _ in range(params.params)]
+        if params.writes:
+            modes[-1] = (Mode.RELATIVE if modes[-1] == Mode.RELATIVE
+                         else Mode.POSITION)
+        if opcode in (5, 6):
+            modes[1] = Mode.IMMEDIATE # Forward target filled in below.
+        if opcode == 2 and jumps:
+            modes[1] = Mode.IMMEDIATE # Keeps loop values from exploding.
+        # A jump could skip the closing ADJUST_BASE, so jumps aren't wrapped.
+        if Mode.RELATIVE in modes and opcode not in (5, 6):
+            shift = rng.randint(-3, 3)
+            units.append([(9, (Mode.IMMEDIATE,), shift),
+                          (opcode, tuple(modes), shift),
+                          (9, (Mode.IMMEDIATE,), -shift)])
+        else:
+            units.append([(opcode, tuple(modes), 0)])
+    # Lay out the code to find where the data starts.
+    def length(opcode):
+        if opcode is None:
+            return 1
+        if opcode == "patch":
+            return 4
+        return IntcodeComputer._OPCODES[opcode].params + 1
+    prologue = 2 if relative else 0
+    starts = []
+    address = prologue
+    for unit in units:
+        starts.append(address)
+        address += sum(length(op) for op, _, _ in unit)
+    tail = address
+    end = tail + (7 if jumps else 0)
+    data_start = end + 1
+    counter = data_start + data - 1
+    writable = data - 1 if jumps else data
+    constants = [0] # After the data, starting with a zero for patches.
+    ints = [109, data_start] if relative else []
+    for i, unit in enumerate(units):
+        for opcode, modes, shift in unit:
+            if opcode is None:
+                ints.append(rng.choice([0, 10, 42, 98]))
+                continue
+            if opcode == "patch":
+                ints.extend(_patch(rng, units[i + 1:], starts[i + 1:], swaps,
+                                   jumps, data_start, data, writable,
+                                   constants))
+                continue
+            if opcode == 9:
+                ints.extend([109, shift])
+                continue
+            ints.append(opcode + sum(mode * 10**(j + 2)
+                                     for j, mode in enumerate(modes)))
+            writes = IntcodeComputer._OPCODES[opcode].writes
+            for j, mode in enumerate(modes):
+                write = j >= len(modes) - writes
+                cell = rng.randrange(writable if write else data)
+                if opcode in (5, 6) and j == 1:
+                    ints.append(rng.choice(starts[i + 1:] + [tail]))
+                elif mode == Mode.IMMEDIATE:
+                    ints.append(rng.randint(-9, 9) if opcode == 2
+                                else rng.randint(-50, 50))
+                elif mode == Mode.RELATIVE:
+                    ints.append(cell - shift)
+                else:
+                    ints.append(data_start + cell)
+    if jumps:
+        ints.extend([1001, counter, -1, counter, 1005, counter, prologue])
+    ints.append(99)
+    ints.extend(rng.randint(-20, 20) for _ in range(data - 1))
+    ints.append(rng.randint(1, 8) if jumps else rng.randint(-20, 20))
+    return ints + constants
+
+def _patch(rng, units, starts, swaps, jumps, data_start, data, writable,
+           constants):
+    # Returns the ADD of a patch over a later plain instruction in units
+    # (or over nothing, writing the zero constant to itself, if there is
+    # none), adding the value it copies to constants.
+    Mode = IntcodeComputer.Mode
+    const_start = data_start + data
+    targets = [(start, unit[0]) for start, unit in zip(starts, units)
+               if len(unit) == 1 and unit[0][0] not in (None, "patch", 5, 6)]
+    if not targets:
+        return [1, const_start, const_start, const_start]
+    start, (opcode, modes, _) = rng.choice(targets)
+    params = IntcodeComputer._OPCODES[opcode]
+    offsets = [j + 1 for j, mode in enumerate(modes) if mode != Mode.RELATIVE]
+    if opcode in swaps:
+        offsets.append(0)
+    offset = rng.choice(offsets)
+    if offset == 0:
+        others = [op for op in swaps if not (op == 2 and jumps
+                  and modes[1] != Mode.IMMEDIATE)]
+        value = rng.choice(others) + sum(mode * 10**(j + 2)
+                                         for j, mode in enumerate(modes))
+    else:
+        j = offset - 1
+        if modes[j] == Mode.IMMEDIATE:
+            value = (rng.randint(-9, 9) if opcode == 2
+                     else rng.randint(-50, 50))
+        else:
+            write = j >= len(modes) - params.writes
+            value = data_start + rng.randrange(writable if write else data)
+    constants.append(value)
+    return [1, const_start + len(constants) - 1, const_start, start + offset]
+
+def check(programs=100, seed=0, engines=None, report=None, self_modify=0.0):
+    """Runs random programs of every subset through each engine supporting
+    it, comparing outputs, final memory and errors with the first one.
+
+    Returns (and writes to the report path, if given) a dict of the
+    mismatches and each engine's instructions per second.
+    """
+    engines = ENGINES if engines is None else engines
+    rng = Random(seed)
+    mismatches = []
+    stats = {engine.name: {"programs": 0, "instructions": 0, "seconds": 0.0}
+             for engine in engines}
+    for subset in SUBSETS:
+        supported = [engine for engine in engines
+                     if set(subset.opcodes) <= set(engine.opcodes)
+                     and set(subset.modes) <= set(engine.modes)]
+        if len(supported) < 2:
+            continue
+        for _ in range(programs):
+            ints = random_program(rng, subset, self_modify=self_modify)
+            value = rng.randint(-10, 10)
+            counter = IntcodeComputer(ints, profile=True)
+            try:
+                list(counter.stream(repeat(value)))
+            except ValueError:
+                pass
+            expected = None
+            for engine in supported:
+                start = perf_counter()
+                result = engine.run(ints, value)
+                seconds = perf_counter() - start
+                stats[engine.name]["programs"] += 1
+                stats[engine.name]["instructions"] += (
+                    counter.stats.instructions)
+                stats[engine.name]["seconds"] += seconds
+                if expected is None:
+                    expected = result
+                elif result != expected:
+                    mismatches.append({
+                        "subset": subset.name,
+                        "engine": engine.name,
+                        "reference": supported[0].name,
+                        "program": ints,
+                        "input": value,
+                        "expected": expected._asdict(),
+                        "got": result._asdict(),
+                    })
+    for engine in stats.values():
+        engine["instructions_per_second"] = (
+            engine["instructions"] / engine["seconds"]
+            if engine["seconds"] else 0.0)
+    result = {"seed": seed, "programs": programs, "self_modify": self_modify,
+              "mismatches": mismatches, "engines": stats}
+    if report is not None:
+        with open(report, "w") as report_file:
+            json.dump(result, report_file, indent=2)
+    return result
+
+def main():
+    result = check(programs=300, report="intcode_conformance.json",
+                   self_modify=0.1)
+    for name, engine in result["engines"].items():
+        print("{:<28} {:>6} programs {:>12,.0f} instructions/s".format(
+              name, engine["programs"], engine["instructions_per_second"]))
+    print("{} mismatches, report in intcode_conformance.json".format(
+          len(result["mismatches"])))
+
+if __name__ == "__main__":
+    main()
+
+class TestConformance(unittest.TestCase):
+    def test_random_program(self):
+        rng = Random(1)
+        for subset in SUBSETS:
+            for _ in range(50):
+                ints = random_program(rng, subset, invalid=0)
+                computer = IntcodeComputer(ints, profile=True)
+                list(computer.stream(repeat(3)))
+                self.assertTrue(computer.is_done())
+                used = set(computer.stats.opcodes)
+                allowed = {IntcodeComputer._OPCODES[op].name
+                           for op in subset.opcodes + (99,)}
+                self.assertLessEqual(used, allowed)
+        ints = random_program(rng, SUBSETS[0], invalid=1)
+        self.assertRaises(ValueError, IntcodeComputer(ints).run)
+
+    def test_engines_agree(self):
+        result = check(programs=40, seed=2)
+        self.assertEqual(result["mismatches"], [])
+        for name, engine in result["engines"].items():
+            self.assertGreater(engine["instructions_per_second"], 0, name)
+
+    def test_self_modifying(self):
+        rng = Random(4)
+        for subset in SUBSETS:
+            for _ in range(50):
+                ints = random_program(rng, subset, invalid=0, self_modify=0.3)
+                computer = IntcodeComputer(ints)
+                list(computer.stream(repeat(3)))
+                self.assertTrue(computer.is_done())
+        result = check(programs=40, seed=5, self_modify=0.3)
+        self.assertEqual(result["mismatches"], [])
+        # An engine that never drops stale decoded instructions is caught
+        # only when programs modify their own code.
+        class StaleIntcodeComputer(IntcodeComputer):
+            def _write(self, address, value):
+                self.memory.write(address, value)
+        engines = ENGINES[2:3] + [Engine("stale", (1, 2, 3, 4, 5, 6, 7, 8, 9),
+                                         (0, 1, 2), computer_engine(
+                                             StaleIntcodeComputer))]
+        self.assertEqual(check(programs=40, seed=5,
+                               engines=engines)["mismatches"], [])
+        result = check(programs=40, seed=5, engines=engines, self_modify=0.3)
+        self.assertTrue(result["mismatches"])
+
+    def test_mismatch_detected(self):
+        class BrokenIntcodeComputer(IntcodeComputer):
+            def _less_than(self, pos):
+                read = self._read
+                self._write(pos[2], 1 if read(pos[0]) <= read(pos[1]) else 0)
+                self.ip += 4
+        engines = ENGINES[1:3] + [Engine("broken", (1, 2, 3, 4, 5, 6, 7, 8),
+                                         (0, 1), computer_engine(
+                                             BrokenIntcodeComputer))]
+        result = check(programs=40, seed=3, engines=engines)
+        self.assertTrue(result["mismatches"])
+        self.assertEqual({m["engine"] for m in result["mismatches"]},
+                         {"broken"})
@@ -0,0 +1,159 @@
+from array import array
+from tempfile import TemporaryDirectory
+import mmap
+import os
+import pickle
+import struct
+import unittest
+
+from intcode import IntcodeComputer
+from intcode import run_many
+
+MAGIC = b"ICB1"
+# Magic, padding, cell count and side table size, keeping cells 8-aligned.
+HEADER = struct.Struct("<4s4xQQ")
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+
+def parse_program(text):
+    return [int(x) for x in text.split(",")]
+
+def image_path(path):
+    """Path of the binary image built for a comma-separated program file."""
+    return os.path.splitext(path)[0] + ".icb"
+
+def write_image(ints, path):
+    """Writes ints as a header, native int64 cells, then a side table of the
+    cells too big for int64 (stored as 0 in the cells). Images are a local
+    cache, so they aren't portable between byte orders."""
+    cells = array("q")
+    big = {}
+    for i, value in enumerate(ints):
+        if INT64_MIN <= value <= INT64_MAX:
+            cells.append(value)
+        else:
+            cells.append(0)
+            big[i] = value
+    side = ",".join("{}:{}".format(i, v) for i, v in big.items()).encode()
+    # Written beside the image and renamed, so readers never see it partial.
+    temp = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp, "wb") as image_file:
+        image_file.write(HEADER.pack(MAGIC, len(cells), len(side)))
+        image_file.write(cells.tobytes())
+        image_file.write(side)
+    os.replace(temp, path)
+
+class ProgramImage:
+    """Read-only program memory-mapped from a binary image.
+
+    Processes mapping the same image share its pages. Pickling sends only
+    the path, so a worker process maps the image instead of copying it.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as image_file:
+            self._mmap = mmap.mmap(image_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size:
+            raise ValueError("{} is not an Intcode image.".format(path))
+        magic, count, side_size = HEADER.unpack_from(self._mmap)
+        end = HEADER.size + 8 * count
+        if magic != MAGIC or len(self._mmap) != end + side_size:
+            raise ValueError("{} is not an Intcode image.".format(path))
+        self.cells = memoryview(self._mmap)[HEADER.size:end].cast("q")
+        side = self._mmap[end:].decode()
+        self.big = {} # {index: value} for cells that don't fit in int64.
+        for entry in side.split(",") if side else ():
+            i, value = entry.split(":")
+            self.big[int(i)] = int(value)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __getitem__(self, i):
+        return self.big.get(i % len(self), self.cells[i])
+
+    def __iter__(self):
+        return iter(self.tolist()) if self.big else iter(self.cells)
+
+    def __reduce__(self):
+        return ProgramImage, (self.path,)
+
+    def tolist(self):
+        ints = self.cells.tolist()
+        for i, value in self.big.items():
+            ints[i] = value
+        return ints
+
+def map_program(path):
+    """Maps the binary image of the program in path, first building it if
+    it is missing or older than path."""
+    image = image_path(path)
+    try:
+        stale = os.stat(path).st_mtime_ns > os.stat(image).st_mtime_ns
+    except FileNotFoundError:
+        stale = True
+    if stale:
+        with open(path) as input_file:
+            write_image(parse_program(input_file.read()), image)
+    return ProgramImage(image)
+
+def load_program(path):
+    """Returns the program in path as a list of ints, via its binary image."""
+    return map_program(path).tolist()
+
+class TestLoader(unittest.TestCase):
+    def setUp(self):
+        self.dir = self.enterContext(TemporaryDirectory())
+        self.path = os.path.join(self.dir, "prog.txt")
+
+    def write_text(self, text, mtime_ns=None):
+        with open(self.path, "w") as text_file:
+            text_file.write(text)
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_load_program(self):
+        self.write_text("104,-5,104,{},99\n".format(2**70))
+        ints = load_program(self.path)
+        self.assertEqual(ints, [104,-5,104,2**70,99])
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "prog.icb")))
+        image = map_program(self.path)
+        self.assertEqual(len(image), 5)
+        self.assertEqual([image[i] for i in range(5)], ints)
+        self.assertEqual(list(image), ints)
+        self.assertEqual(IntcodeComputer(image).run(), [-5, 2**70])
+        self.assertEqual(load_program(self.path), ints)
+
+    def test_rebuild_stale_image(self):
+        self.write_text("104,1,99", mtime_ns=10**18)
+        self.assertEqual(load_program(self.path), [104,1,99])
+        image_mtime = os.stat(image_path(self.path)).st_mtime_ns
+        self.write_text("104,2,99", mtime_ns=image_mtime - 10**9)
+        self.assertEqual(load_program(self.path), [104,1,99]) # Still fresh.
+        self.write_text("104,2,99", mtime_ns=image_mtime + 10**9)
+        self.assertEqual(load_program(self.path), [104,2,99])
+
+    def test_invalid_image(self):
+        path = os.path.join(self.dir, "bad.icb")
+        with open(path, "wb") as image_file:
+            image_file.write(b"not an image at all, no")
+        self.assertRaises(ValueError, ProgramImage, path)
+
+    def test_shared_image(self):
+        self.write_text("3,9,1002,9,3,9,4,9,99,0")
+        image = map_program(self.path)
+        copy = pickle.loads(pickle.dumps(image))
+        self.assertEqual(copy.path, image.path)
+        self.assertEqual(list(copy), list(image))
+        results = run_many(image, [[1], [2], [3]], workers=2)
+        self.assertEqual([r.outputs for r in results], [3, 6, 9])
+
+    def test_day_programs(self):
+        for day in ("02", "05", "07", "09", "11", "13"):
+            with open("day{}.txt".format(day)) as input_file:
+                ints = parse_program(input_file.read())
+            with TemporaryDirectory() as temp:
+                path = os.path.join(temp, "day{}.icb".format(day))
+                write_image(ints, path)
+                self.assertEqual(ProgramImage(path).tolist(), ints)
@@ -0,0 +1,266 @@
+from collections import deque
+import asyncio
+import unittest
+
+from intcode import IntcodeComputer
+
+class Channel:
+    """Bounded FIFO of values between nodes of one Network.
+
+    Unlike asyncio.Queue, a task woken by a put or get is marked as running
+    again by the task that woke it, so the network always knows exactly how
+    many of its nodes are blocked.
+    """
+    def __init__(self, network, capacity):
+        self.network = network
+        self.capacity = capacity
+        self.items = deque()
+        self._getters = deque()
+        self._putters = deque()
+
+    def __len__(self):
+        return len(self.items)
+
+    async def put(self, value):
+        while len(self.items) >= self.capacity:
+            await self._block(self._putters)
+        self.items.append(value)
+        self._wake(self._getters)
+
+    async def get(self):
+        while not self.items:
+            await self._block(self._getters)
+        value = self.items.popleft()
+        self._wake(self._putters)
+        return value
+
+    async def _block(self, waiters):
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        self.network._blocked += 1
+        self.network._check_idle()
+        await future
+
+    def _wake(self, waiters):
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                self.network._blocked -= 1
+                future.set_result(None)
+                return
+
+class Node:
+    def __init__(self, network, computer, fan_out, capacity):
+        self.computer = computer
+        self.inbox = Channel(network, capacity)
+        self.targets = [] # Nodes that receive this node's outputs.
+        self.fan_out = fan_out
+        self.outputs = [] # Every value this node has output.
+        self._next_target = 0
+
+class Network:
+    """IntcodeComputers run as asyncio tasks, connected by bounded channels.
+
+    Each node's outputs go to every node it is connected to ("broadcast"),
+    or to one of them in turn ("round_robin"). run() returns once no node
+    can make progress: every node has halted or is blocked on a channel.
+    """
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.nodes = []
+        self._blocked = 0
+        self._halted = 0
+        self._idle = None
+        self._error = None
+
+    def add(self, computer, inputs=(), fan_out="broadcast"):
+        """Adds a node running computer (or a program) and returns it."""
+        if fan_out not in ("broadcast", "round_robin"):
+            raise ValueError("Invalid fan out {}.".format(fan_out))
+        if not isinstance(computer, IntcodeComputer):
+            computer = IntcodeComputer(computer)
+        computer.wait_for_input = True
+        node = Node(self, computer, fan_out, self.capacity)
+        node.inbox.items.extend(inputs)
+        self.nodes.append(node)
+        return node
+
+    def connect(self, source, target):
+        source.targets.append(target)
+
+    def chain(self, nodes, ring=False):
+        """Connects each node to the next, and the last to the first if ring."""
+        for source, target in zip(nodes, nodes[1:]):
+            self.connect(source, target)
+        if ring and nodes:
+            self.connect(nodes[-1], nodes[0])
+
+    def send(self, node, value):
+        """Queues an input for node before the network runs."""
+        node.inbox.items.append(value)
+
+    def halted(self):
+        return all(node.computer.is_done() for node in self.nodes)
+
+    async def run(self):
+        """Runs until quiescent. Returns True if every node halted, False if
+        some are deadlocked waiting on each other."""
+        self._idle = asyncio.Event()
+        self._blocked = 0
+        self._halted = sum(node.computer.is_done() for node in self.nodes)
+        self._check_idle()
+        tasks = [asyncio.create_task(self._run_node(node))
+                 for node in self.nodes if not node.computer.is_done()]
+        await self._idle.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._error is not None:
+            raise self._error
+        return self.halted()
+
+    async def _run_node(self, node):
+        computer = node.computer
+        pending = deque()
+        try:
+            while not computer.is_done():
+                for value in computer.stream(pending):
+                    node.outputs.append(value)
+                    await self._send(node, value)
+                if not computer.is_done():
+                    pending.append(await node.inbox.get())
+            self._halted += 1
+        except Exception as error:
+            self._error = error
+            self._idle.set()
+            return
+        self._check_idle()
+
+    async def _send(self, node, value):
+        if node.fan_out == "broadcast":
+            for target in node.targets:
+                await target.inbox.put(value)
+        elif node.targets:
+            target = node.targets[node._next_target % len(node.targets)]
+            node._next_target += 1
+            await target.inbox.put(value)
+
+    def _check_idle(self):
+        if self._blocked + self._halted >= len(self.nodes):
+            self._idle.set()
+
+def run_networks(networks):
+    """Runs independent networks concurrently in one event loop and returns
+    each one's Network.run() result."""
+    async def run_all():
+        return await asyncio.gather(*(network.run() for network in networks))
+    return asyncio.run(run_all())
+
+class TestNetwork(unittest.TestCase):
+    # Reads a value, outputs it plus one, and repeats.
+    increment = [3,11,1001,11,1,11,4,11,1105,1,0,0]
+    # Reads a value and outputs it doubled, then halts.
+    double = [3,9,1002,9,2,9,4,9,99,0]
+    # Outputs 0..99, then halts.
+    producer = [104,0,1001,1,1,1,1007,1,100,14,1005,14,0,99,0]
+
+    def test_chain(self):
+        network = Network()
+        nodes = [network.add(self.double) for _ in range(10)]
+        network.chain(nodes)
+        network.send(nodes[0], 3)
+        self.assertTrue(run_networks([network])[0])
+        self.assertEqual(nodes[-1].outputs, [3 * 2**10])
+
+    def test_ring(self):
+        ints = [3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,
+                27,4,27,1001,28,-1,28,1005,28,6,99,0,0,5]
+        network = Network()
+        amps = [network.add(ints, [phase]) for phase in (9,8,7,6,5)]
+        network.chain(amps, ring=True)
+        network.send(amps[0], 0)
+        self.assertTrue(run_networks([network])[0])
+        self.assertEqual(amps[-1].outputs[-1], 139629729)
+
+    def test_fan_out(self):
+        network = Network()
+        source = network.add([104,1,104,2,104,3,104,4,99])
+        broadcast = network.add([104,0,99], fan_out="broadcast")
+        round_robin = network.add([104,0,99], fan_out="round_robin")
+        sinks = [network.add(self.increment, fan_out="round_robin")
+                 for _ in range(2)]
+        network.connect(source, round_robin)
+        for sink in sinks:
+            network.connect(source, sink)
+        self.assertFalse(run_networks([network])[0]) # Sinks never halt.
+        self.assertEqual([sink.outputs for sink in sinks], [[2, 3, 4, 5]] * 2)
+        self.assertEqual(round_robin.outputs, [0])
+        self.assertEqual(broadcast.outputs, [0])
+        # Round robin alternates between targets.
+        network = Network()
+        source = network.add([104,1,104,2,104,3,104,4,99],
+                             fan_out="round_robin")
+        sinks = [network.add(self.increment) for _ in range(2)]
+        for sink in sinks:
+            network.connect(source, sink)
+        run_networks([network])
+        self.assertEqual([sink.outputs for sink in sinks], [[2, 4], [3, 5]])
+        self.assertRaises(ValueError, network.add, [99], fan_out="random")
+
+    def test_deadlock(self):
+        network = Network()
+        a = network.add(self.increment)
+        b = network.add(self.increment)
+        network.chain([a, b], ring=True)
+        self.assertFalse(run_networks([network])[0])
+        self.assertEqual([a.outputs, b.outputs], [[], []])
+
+    def test_backpressure(self):
+        # The producer's outputs go into a channel holding one value.
+        network = Network(capacity=1)
+        source = network.add(self.producer)
+        sink = network.add(self.increment)
+        network.connect(source, sink)
+        self.assertFalse(run_networks([network])[0])
+        self.assertEqual(sink.outputs, list(range(1, 101)))
+        self.assertTrue(source.computer.is_done())
+
+    def test_already_halted(self):
+        # Nodes that halted before the run count once towards quiescence.
+        network = Network(capacity=1)
+        for _ in range(2):
+            network.add([99]).computer.run()
+        source = network.add(self.producer)
+        sink = network.add(self.increment)
+        network.connect(source, sink)
+        self.assertFalse(run_networks([network])[0])
+        self.assertEqual(sink.outputs, list(range(1, 101)))
+        # Rerunning a finished network returns straight away.
+        network = Network()
+        nodes = [network.add(self.double) for _ in range(2)]
+        network.chain(nodes)
+        network.send(nodes[0], 5)
+        self.assertTrue(run_networks([network])[0])
+        self.assertEqual(nodes[-1].outputs, [20])
+        self.assertTrue(run_networks([network])[0])
+        self.assertEqual(nodes[-1].outputs, [20])
+
+    def test_many_networks(self):
+        networks = []
+        ends = []
+        for start in range(20):
+            network = Network()
+            nodes = [network.add(self.double) for _ in range(3)]
+            network.chain(nodes)
+            network.send(nodes[0], start)
+            networks.append(network)
+            ends.append(nodes[-1])
+        self.assertEqual(run_networks(networks), [True] * 20)
+        self.assertEqual([end.outputs for end in ends],
+                         [[8 * start] for start in range(20)])
+
+    def test_error(self):
+        network = Network()
+        network.add([1055,0,99])
+        network.add(self.increment)
+        self.assertRaises(ValueError, run_networks, [network])
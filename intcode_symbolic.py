@@ -0,0 +1,307 @@
+from itertools import product
+from unittest.mock import patch
+import unittest
+
+from intcode import IntcodeComputer
+from intcode import Memory
+from intcode import run_many
+from intcode_loader import load_program
+
+Mode = IntcodeComputer.Mode
+SOLVE_BLOCK = 4096 # Combinations run per batch when solving by brute force.
+
+class SymbolicBranch(Exception):
+    """Raised when control flow or an address depends on a symbol."""
+
+class Polynomial:
+    """Integer polynomial over symbols, stored as {monomial: coefficient}.
+
+    A monomial is a sorted tuple of symbols, repeated for each power, so
+    x**2 * y is (x, x, y) and the constant term is ().
+    """
+    def __init__(self, terms):
+        self.terms = {monomial: coefficient
+                      for monomial, coefficient in terms.items() if coefficient}
+
+    @classmethod
+    def symbol(cls, name):
+        return cls({(name,): 1})
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        for monomial, coefficient in _terms(other).items():
+            terms[monomial] = terms.get(monomial, 0) + coefficient
+        return Polynomial(terms).simplify()
+
+    __radd__ = __add__
+
+    def __mul__(self, other):
+        terms = {}
+        for (m1, c1), (m2, c2) in product(self.terms.items(),
+                                          _terms(other).items()):
+            monomial = tuple(sorted(m1 + m2))
+            terms[monomial] = terms.get(monomial, 0) + c1 * c2
+        return Polynomial(terms).simplify()
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        return self.terms == _terms(other)
+
+    def __repr__(self):
+        if not self.terms:
+            return "0"
+        return " + ".join("*".join([str(c)] * (c != 1 or not m) +
+                                   ["m[{}]".format(s) for s in m])
+                          for m, c in sorted(self.terms.items()))
+
+    def simplify(self):
+        """Returns the constant as an int if there are no symbols left."""
+        if not any(self.terms):
+            return self.terms.get((), 0)
+        return self
+
+    def degree(self, symbol):
+        return max(monomial.count(symbol) for monomial in self.terms)
+
+    def substitute(self, values):
+        """Replaces the symbols in values ({symbol: int}) with their values."""
+        terms = {}
+        for monomial, coefficient in self.terms.items():
+            rest = []
+            for symbol in monomial:
+                if symbol in values:
+                    coefficient *= values[symbol]
+                else:
+                    rest.append(symbol)
+            terms[tuple(rest)] = terms.get(tuple(rest), 0) + coefficient
+        return Polynomial(terms).simplify()
+
+def _terms(value):
+    return value.terms if isinstance(value, Polynomial) else {(): value}
+
+class _Unknown:
+    # A value read through a symbolic address. It is harmless until used.
+    def __repr__(self):
+        return "UNKNOWN"
+
+UNKNOWN = _Unknown()
+
+class SymbolicIntcodeComputer:
+    """Runs an Intcode program with some memory cells left symbolic.
+
+    Each symbolic cell holds a Polynomial in the cell's address, and ADD and
+    MULTIPLY carry polynomials through. Reads through a symbolic address give
+    UNKNOWN, which is fine as long as it is overwritten before it matters. A
+    symbol (or UNKNOWN) in an instruction, jump condition, comparison, base
+    adjustment or write address raises SymbolicBranch.
+    """
+    def __init__(self, ints, symbols):
+        self.memory = Memory(ints)
+        for address in symbols:
+            self.memory.write(address, Polynomial.symbol(address))
+        self.ip = 0
+        self.base = 0
+        self.done = False
+
+    def read(self, address):
+        if not isinstance(address, int):
+            return UNKNOWN
+        return self.memory.read(address)
+
+    def run(self, inputs=()):
+        """Runs to completion with concrete inputs and returns the outputs,
+        which may be Polynomials or UNKNOWN."""
+        inputs = iter(inputs)
+        outputs = []
+        while not self.done:
+            instruction = self._concrete(self.read(self.ip), "Instruction")
+            opcode, modes = IntcodeComputer._parse_instruction(instruction)
+            pos = [self._address(j, mode) for j, mode in enumerate(modes)]
+            args = [self.read(p) for p in pos]
+            self.ip += len(modes) + 1
+            if opcode == 1:
+                self._write(pos[2], _combine(args[0], args[1], add=True))
+            elif opcode == 2:
+                self._write(pos[2], _combine(args[0], args[1], add=False))
+            elif opcode == 3:
+                value = next(inputs, None)
+                if value is None:
+                    raise ValueError("Input instruction missing input.")
+                self._write(pos[0], value)
+            elif opcode == 4:
+                outputs.append(args[0])
+            elif opcode == 5 or opcode == 6:
+                condition = self._concrete(args[0], "Jump condition")
+                if (condition != 0) == (opcode == 5):
+                    self.ip = self._concrete(args[1], "Jump target")
+            elif opcode == 7 or opcode == 8:
+                a = self._concrete(args[0], "Comparison")
+                b = self._concrete(args[1], "Comparison")
+                self._write(pos[2], int(a < b if opcode == 7 else a == b))
+            elif opcode == 9:
+                self.base += self._concrete(args[0], "Base adjustment")
+            elif opcode == 99:
+                self.done = True
+        return outputs
+
+    def _address(self, j, mode):
+        param = self.read(self.ip + 1 + j)
+        if mode == Mode.IMMEDIATE:
+            return self.ip + 1 + j
+        elif mode == Mode.RELATIVE:
+            return _combine(self.base, param, add=True)
+        return param
+
+    def _write(self, address, value):
+        self.memory.write(self._concrete(address, "Write address"), value)
+
+    def _concrete(self, value, what):
+        if isinstance(value, int):
+            return value
+        raise SymbolicBranch("{} near ip {} depends on {}.".format(
+                             what, self.ip, value))
+
+def _combine(a, b, add):
+    if a is UNKNOWN or b is UNKNOWN:
+        return UNKNOWN
+    if not isinstance(a, Polynomial) and not isinstance(b, Polynomial):
+        return a + b if add else a * b
+    if not isinstance(a, Polynomial):
+        a, b = b, a
+    return a + b if add else a * b
+
+def solve(ints, target, address=0, symbols=None, inputs=(), workers=None):
+    """Finds values for memory cells that leave target at address.
+
+    symbols maps each cell to patch to the values it may take, by default
+    day02's noun and verb: {1: range(100), 2: range(100)}. Returns a
+    {cell: value} dict for the first solution in the order of
+    itertools.product over the ranges, or None. The program is run once
+    symbolically and the polynomial left at address is solved; if a symbol
+    affects control flow, every combination is run with run_many instead.
+    """
+    if symbols is None:
+        symbols = {1: range(100), 2: range(100)}
+    cells = list(symbols)
+    try:
+        computer = SymbolicIntcodeComputer(ints, cells)
+        computer.run(inputs)
+        value = computer.read(address)
+        if value is not UNKNOWN:
+            solution = _solve_polynomial(value, target, cells, symbols)
+            if solution is None or _check(ints, target, address, inputs,
+                                          solution):
+                return solution
+    except SymbolicBranch:
+        pass
+    combinations = list(product(*(symbols[cell] for cell in cells)))
+    patches = [dict(zip(cells, values)) for values in combinations]
+    # Runs complete out of order across workers, so each block is searched
+    # in full for its earliest match before moving on to the next block.
+    def earliest(a, b):
+        matches = [r for r in (a, b) if r.cells[0] == target]
+        return min(matches, key=lambda r: r.index) if matches else a
+    for start in range(0, len(combinations), SOLVE_BLOCK):
+        block = patches[start:start + SOLVE_BLOCK]
+        result = run_many(ints, [list(inputs)] * len(block), patches=block,
+                          read=[address], workers=workers, reducer=earliest)
+        if result is not None and result.cells[0] == target:
+            return dict(zip(cells, combinations[start + result.index]))
+    return None
+
+def _solve_polynomial(value, target, cells, symbols):
+    # Tries every combination of all but the last symbol, then solves for
+    # the last one directly when the polynomial is linear in it.
+    if not isinstance(value, Polynomial):
+        if value != target:
+            return None
+        return {cell: next(iter(symbols[cell]), None) for cell in cells}
+    *outer, last = cells
+    for values in product(*(symbols[cell] for cell in outer)):
+        rest = value.substitute(dict(zip(outer, values)))
+        if isinstance(rest, Polynomial) and rest.degree(last) > 1:
+            candidates = [x for x in symbols[last]
+                          if rest.substitute({last: x}) == target]
+        else:
+            slope = (rest.substitute({last: 1}) - rest.substitute({last: 0})
+                     if isinstance(rest, Polynomial) else 0)
+            offset = (rest.substitute({last: 0})
+                      if isinstance(rest, Polynomial) else rest)
+            if slope == 0:
+                candidates = list(symbols[last])[:1] if offset == target else []
+            elif (target - offset) % slope == 0:
+                x = (target - offset) // slope
+                candidates = [x] if x in symbols[last] else []
+            else:
+                candidates = []
+        if candidates:
+            return dict(zip(cells, values + (candidates[0],)))
+    return None
+
+def _check(ints, target, address, inputs, solution):
+    # Reads through symbolic addresses were assumed harmless; confirm it.
+    computer = IntcodeComputer(ints)
+    for cell, value in solution.items():
+        computer.memory.write(cell, value)
+    try:
+        computer.run(list(inputs))
+    except ValueError:
+        return False
+    return computer.memory.read(address) == target
+
+class TestSymbolicIntcode(unittest.TestCase):
+    def test_polynomial(self):
+        x, y = Polynomial.symbol(1), Polynomial.symbol(2)
+        self.assertEqual((x + 2) * (x + y), x * x + x * y + 2 * x + 2 * y)
+        self.assertEqual(x * 3 + x * -3, 0)
+        self.assertEqual((x * x * y).degree(1), 2)
+        self.assertEqual((x * y + 1).substitute({1: 3, 2: 4}), 13)
+        self.assertEqual((x * y + 1).substitute({1: 3}), 3 * y + 1)
+
+    def test_symbolic_run(self):
+        # m[3] = m[noun] + m[verb] is overwritten by m[3] = noun + verb,
+        # and then m[0] = m[3] * m[15].
+        ints = [1,0,0,3,1,1,2,3,2,3,15,0,99,0,0,5]
+        computer = SymbolicIntcodeComputer(ints, [1, 2])
+        computer.run()
+        noun, verb = Polynomial.symbol(1), Polynomial.symbol(2)
+        self.assertEqual(computer.read(0), 5 * noun + 5 * verb)
+        self.assertEqual(SymbolicIntcodeComputer([4,1,99], [1]).run(),
+                         [UNKNOWN])
+        self.assertEqual(SymbolicIntcodeComputer([104,0,99], [1]).run(),
+                         [Polynomial.symbol(1)])
+        self.assertRaises(SymbolicBranch,
+                          SymbolicIntcodeComputer([1005,1,0,99], [1]).run)
+        self.assertRaises(SymbolicBranch,
+                          SymbolicIntcodeComputer([1101,0,0,0,99], [0]).run)
+
+    def test_solve(self):
+        ints = [1,0,0,3,1,1,2,3,2,3,15,0,99,0,0,5]
+        self.assertEqual(solve(ints, 50), {1: 0, 2: 10})
+        self.assertEqual(solve(ints, 51), None)
+        # Both read m[noun] + m[verb] into m[9] first, which goes unused.
+        product_ints = [1,0,0,9,2,1,2,0,99,0]
+        self.assertEqual(solve(product_ints, 42), {1: 1, 2: 42})
+        square = [1,0,0,9,2,1,1,0,99,0]
+        self.assertEqual(solve(square, 144, symbols={1: range(20)}), {1: 12})
+        self.assertEqual(solve([1101,0,0,0,99], 0), {1: 0, 2: 0})
+
+    def test_solve_fallback(self):
+        # Address 9 decides a jump, so every value is run concretely.
+        ints = [1005,9,7,1101,1,1,10,99,0,0,0]
+        self.assertEqual(solve(ints, 2, address=10,
+                               symbols={9: range(-3, 4)}, workers=1), {9: 0})
+        # Every value but 0 is a solution, and the first one wins however
+        # the runs are spread across workers and blocks.
+        with patch(__name__ + ".SOLVE_BLOCK", 100):
+            self.assertEqual(solve(ints, 0, address=10,
+                                   symbols={9: range(-300, 300)}, workers=2),
+                             {9: -300})
+            self.assertEqual(solve(ints, 2, address=10,
+                                   symbols={9: range(-300, 300)}, workers=2),
+                             {9: 0})
+
+    def test_solve_day02(self):
+        ints = load_program("day02.txt")
+        self.assertEqual(solve(ints, 19690720), {1: 49, 2: 25})
@@ -0,0 +1,120 @@
+from io import StringIO
+from time import monotonic
+import sys
+import unittest
+
+class Renderer:
+    """Draws frames (lists of row strings) to a terminal, one write each.
+
+    Without live, each frame is written out in full. With live, the first
+    frame clears the screen and later frames only redraw the cells that
+    changed, positioning the cursor with escape codes. Frames arriving
+    faster than max_fps are skipped, so rendering can't slow down whatever
+    produces them; force a frame to always draw it.
+    """
+    def __init__(self, out=None, live=False, max_fps=30):
+        self.out = out or sys.stdout
+        self.live = live
+        self.min_interval = 1 / max_fps if max_fps else 0
+        self.frames = 0 # Frames actually written.
+        self._previous = None
+        self._last_time = None
+
+    def due(self):
+        """Whether render() would draw a frame now, so callers can skip
+        building frames that would be dropped."""
+        return (self._last_time is None or
+                monotonic() - self._last_time >= self.min_interval)
+
+    def render(self, rows, force=False):
+        """Draws the frame if due (or forced). Returns whether it drew."""
+        if not force and not self.due():
+            return False
+        self._last_time = monotonic()
+        if not self.live:
+            text = "".join(row + "\n" for row in rows)
+        elif self._previous is None:
+            text = "\x1b[2J\x1b[H" + "\n".join(rows)
+        else:
+            text = self._diff(self._previous, rows)
+        if self.live:
+            self._previous = list(rows)
+        if text:
+            self.out.write(text)
+            self.out.flush()
+        self.frames += 1
+        return True
+
+    def close(self):
+        """Moves the cursor below a live frame."""
+        if self.live and self._previous is not None:
+            self.out.write("\x1b[{};1H\n".format(len(self._previous) + 1))
+            self.out.flush()
+
+    @staticmethod
+    def _diff(previous, rows):
+        parts = []
+        for y, row in enumerate(rows):
+            old = previous[y] if y < len(previous) else ""
+            if row == old:
+                continue
+            old_length = len(old)
+            if old_length < len(row):
+                old += " " * (len(row) - old_length)
+            x = 0
+            while x < len(row):
+                if row[x] == old[x]:
+                    x += 1
+                    continue
+                start = x # Redraw each run of changed cells in one go.
+                while x < len(row) and row[x] != old[x]:
+                    x += 1
+                parts.append("\x1b[{};{}H{}".format(y + 1, start + 1,
+                                                    row[start:x]))
+            if old_length > len(row): # Clear the rest of a shorter row.
+                parts.append("\x1b[{};{}H\x1b[K".format(y + 1, len(row) + 1))
+        for y in range(len(rows), len(previous)):
+            parts.append("\x1b[{};1H\x1b[K".format(y + 1))
+        return "".join(parts)
+
+def render(rows, out=None):
+    """Writes a single frame in full with one call."""
+    Renderer(out, max_fps=0).render(rows)
+
+class TestRenderer(unittest.TestCase):
+    def test_render(self):
+        out = StringIO()
+        render(["ab", " c"], out)
+        self.assertEqual(out.getvalue(), "ab\n c\n")
+
+    def test_live(self):
+        out = StringIO()
+        renderer = Renderer(out, live=True, max_fps=0)
+        renderer.render(["abcd", "efgh"])
+        self.assertEqual(out.getvalue(), "\x1b[2J\x1b[Habcd\nefgh")
+        out.seek(0)
+        out.truncate()
+        renderer.render(["abXY", "efgh", "ij"])
+        self.assertEqual(out.getvalue(), "\x1b[1;3HXY\x1b[3;1Hij")
+        out.seek(0)
+        out.truncate()
+        renderer.render(["a", "efgh"])
+        self.assertEqual(out.getvalue(),
+                         "\x1b[1;2H\x1b[K\x1b[3;1H\x1b[K")
+        out.seek(0)
+        out.truncate()
+        renderer.render(["a", "efgh"]) # Nothing changed, nothing written.
+        self.assertEqual(out.getvalue(), "")
+        renderer.close()
+        self.assertEqual(out.getvalue(), "\x1b[3;1H\n")
+
+    def test_frame_rate(self):
+        out = StringIO()
+        renderer = Renderer(out, max_fps=1e-9)
+        self.assertTrue(renderer.due())
+        self.assertTrue(renderer.render(["a"]))
+        self.assertFalse(renderer.due())
+        self.assertFalse(renderer.render(["b"]))
+        self.assertTrue(renderer.render(["c"], force=True))
+        self.assertEqual(out.getvalue(), "a\nc\n")
+        self.assertEqual(renderer.frames, 2)